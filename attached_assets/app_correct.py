@@ -5,6 +5,7 @@ st.set_page_config(page_title="TRUCCO", page_icon="🡕", layout="wide")
 from dashboard import mostrar_dashboard
 import pandas as pd
 import base64
+import hashlib
 import os
 
 # Performance optimization: Set pandas options
@@ -15,11 +16,87 @@ def get_asset_path(filename):
     current_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(current_dir, "assets", filename)
 
+# Copia en Parquet de las hojas ya limpias, para no volver a parsear el Excel tras un reinicio
+PARQUET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+HOJAS_PARQUET = ("productos", "traspasos", "ventas")
+
+PARQUET_CACHE_MAX_ARCHIVOS = 5  # Excels distintos que se conservan en caché (los más recientes)
+# Versión del formato de la caché: subirla cada vez que cambie la limpieza o los tipos de load_excel_data,
+# para que no se sigan sirviendo hojas escritas por una versión anterior
+PARQUET_CACHE_VERSION = 1
+
+def get_parquet_paths(file):
+    """Rutas Parquet de un Excel subido, identificadas por la versión de la caché y el hash de su contenido"""
+    huella = hashlib.sha1(file.getvalue()).hexdigest()[:16]
+    return [
+        os.path.join(PARQUET_CACHE_DIR, f"v{PARQUET_CACHE_VERSION}_{huella}_{hoja}.parquet")
+        for hoja in HOJAS_PARQUET
+    ]
+
+def borrar_parquet(paths):
+    """Eliminar los archivos Parquet indicados, ignorando los que ya no existen"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def leer_cache_parquet(parquet_paths):
+    """Leer las tres hojas desde Parquet; si alguna falta o está dañada, borrar la caché y devolver None"""
+    if not all(os.path.exists(path) for path in parquet_paths):
+        return None
+    try:
+        datos = tuple(pd.read_parquet(path, memory_map=True) for path in parquet_paths)
+        # Marcar el uso para que la limpieza conserve los Excels usados recientemente
+        for path in parquet_paths:
+            os.utime(path)
+        return datos
+    except Exception:
+        # Archivo truncado o ilegible: se descarta y se vuelve a leer el Excel
+        borrar_parquet(parquet_paths)
+        return None
+
+def guardar_cache_parquet(dfs, parquet_paths):
+    """Guardar las hojas en Parquet de forma atómica (archivo temporal + os.replace) y acotar el tamaño de la caché"""
+    os.makedirs(PARQUET_CACHE_DIR, exist_ok=True)
+    for df, path in zip(dfs, parquet_paths):
+        path_tmp = f"{path}.tmp"
+        try:
+            df.to_parquet(path_tmp, compression='zstd')
+            os.replace(path_tmp, path)
+        except Exception:
+            borrar_parquet([path_tmp])
+            raise
+    limpiar_cache_parquet()
+
+def limpiar_cache_parquet():
+    """Borrar las hojas de otras versiones de la caché y conservar solo los PARQUET_CACHE_MAX_ARCHIVOS Excels usados más recientemente"""
+    prefijo_version = f"v{PARQUET_CACHE_VERSION}_"
+    grupos = {}
+    for nombre in os.listdir(PARQUET_CACHE_DIR):
+        if nombre.endswith(".parquet"):
+            path = os.path.join(PARQUET_CACHE_DIR, nombre)
+            if not nombre.startswith(prefijo_version):
+                borrar_parquet([path])
+                continue
+            # Clave del Excel: versión + hash, sin el nombre de la hoja
+            grupos.setdefault(nombre.rsplit("_", 1)[0], []).append(path)
+    # Antigüedad de cada Excel: la del más reciente de sus archivos
+    por_antiguedad = sorted(grupos.values(), key=lambda paths: max(os.path.getmtime(p) for p in paths), reverse=True)
+    for paths in por_antiguedad[PARQUET_CACHE_MAX_ARCHIVOS:]:
+        borrar_parquet(paths)
+
 # Cached function for loading Excel data
 @st.cache_data
 def load_excel_data(file):
     """Cache the Excel file loading to avoid reprocessing on every interaction - OPTIMIZED VERSION"""
     try:
+        # OPTIMIZATION: Si el mismo archivo ya se procesó, leer el Parquet (columnar + mmap)
+        parquet_paths = get_parquet_paths(file)
+        datos_cache = leer_cache_parquet(parquet_paths)
+        if datos_cache is not None:
+            return datos_cache
+        
         # OPTIMIZATION: Use more efficient Excel reading
         xls = pd.ExcelFile(file, engine="openpyxl")
         
@@ -85,6 +162,14 @@ def load_excel_data(file):
             empty_cols = [col for col in empty_cols if col != 'url_image']
             df.drop(columns=empty_cols, inplace=True)
         
+        # Guardar en Parquet para los próximos arranques; un fallo aquí no debe impedir el análisis
+        try:
+            guardar_cache_parquet((df_productos, df_traspasos, df_ventas), parquet_paths)
+        except Exception as e:
+            # Sin las tres hojas completas no se reutiliza nada: borrar lo que se haya escrito
+            borrar_parquet(parquet_paths)
+            st.warning(f"No se pudo guardar la caché Parquet: {e}")
+        
         return df_productos, df_traspasos, df_ventas
         
     except Exception as e:
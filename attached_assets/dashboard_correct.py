@@ -1,36 +1,19 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
-import seaborn as sns
 import re  # Add re import for regex
 import os
 import joblib
 import json
 from datetime import datetime, timedelta
+from functools import lru_cache
 import numpy as np
 from catboost import Pool
 import io
+import hashlib
 
 
-# Configuración estilo gráfico general (sin líneas de fondo)
-plt.rcParams.update({
-    "axes.edgecolor": "#E0E0E0",
-    "axes.linewidth": 0.8,
-    "axes.titlesize": 14,
-    "axes.titleweight": 'bold',
-    "axes.labelcolor": "#333333",
-    "axes.labelsize": 12,
-    "xtick.color": "#666666",
-    "ytick.color": "#666666",
-    "font.family": "DejaVu Sans",
-    "figure.facecolor": "white",
-    "axes.facecolor": "white",
-    "figure.autolayout": True,
-    "figure.constrained_layout.use": True
-})
-
 # Paletas de colores personalizadas
 COLOR_GRADIENT = ["#e6f3ff", "#cce7ff", "#99cfff", "#66b8ff", "#33a0ff", "#0088ff", "#006acc", "#004d99", "#003366"]
 TEMPORADA_COLORS = ["#e6f3ff", "#99ccff", "#4d94ff", "#0066cc", "#004d99", "#003366", "#001a33", "#000d1a", "#000000"]
@@ -45,36 +28,198 @@ tiendas_a_eliminar = [
     "W001 DEVOLUCIONES WEB (NO ENVIAR TRASP)"
 ]
 
+# Tiendas online específicas (para KPIs de tipo de tienda)
+TIENDAS_ONLINE = frozenset([
+    'ECI NAELLE ONLINE',
+    'ECI ONLINE GESTION',
+    'ET0N ECI ONLINE',
+    'NAELLE ONLINE B2C',
+    'OUTLET TRUCCO ONLINE B2O',
+    'TRUCCO ONLINE B2C'
+])
+
+# Valores de Tema_temporada que no corresponden a un tema real
+TEMAS_INVALIDOS = frozenset(['Sin Tema', 'nan', 'None'])
+
+# Coordenadas (lat, lon) de las tiendas de España para el mapa de ventas
+TIENDA_A_COORD = {
+    # --- EN ---
+    'EN02- VALENCIA ECI PINTOR SOROLLA': (39.4702, -0.3768),
+    'EN03- SANCHINARRO ECI': (40.4940, -3.6620),
+    'EN04- VITORIA ECI': (42.8467, -2.6716),
+    'EN05-ZARAGOZA': (41.6488, -0.8891),
+    'EN07- GOYA ECI': (40.4240, -3.6800),
+    'EN08- BILBAO ECI': (43.2630, -2.9350),
+    'EN09- LAS PALMAS MESA Y LOPEZ ECI': (28.1297, -15.4457),
+    'EN11- LEON ECI': (42.5987, -5.5671),
+    'EN13- CASTELLON ECI': (39.9864, -0.0513),
+    'EN14- CORUÑA ECI': (43.3623, -8.4115),
+    'EN15- VALLADOLID ECI': (41.6523, -4.7245),
+    'EN16- GIJON ECI': (43.5322, -5.6611),
+    'EN19- SANTANDER': (43.4623, -3.8099),
+    'EN24- 7 PALMAS -GRAN CANARIA EC': (28.1081, -15.4565),
+    'EN25- MALLORCA ECI NAELLE': (39.5712, 2.6490),
+    'EN26- VALENCIA AVDA.FRANCIA ECI NAELLE': (39.4615, -0.3400),
+    'EN27- VAGUADA ECI NAELLE': (40.4786, -3.7114),
+    'EN28- GRANADA GENIL ECI NAELLE': (37.1765, -3.5979),
+    'EN29- VIGO ECI NAELLE': (42.2406, -8.7207),
+    'EN30- PRINCESA ECI NAELLE': (40.4254, -3.7171),
+    'EN33- ALICANTE ECI NAELLE': (38.3452, -0.4810),
+    'EN34- PRECIADOS ECI NAELLE': (40.4180, -3.7040),
+    'EN35- VALLADOLID ZORRILLA ECI NAELLE': (41.6360, -4.7280),
+    'EN36- SEVILLA DUQUE ECI NAELLE': (37.3908, -5.9955),
+    'EN37- CORDOBA RONDA ECI NAELLE': (37.8882, -4.7794),
+    'EN38- CORDOBA TEJARES ECI NAELLE': (37.8882, -4.7794),
+    'EN39- ALBACETE ECI NAELLE': (38.9943, -1.8585),
+    'EN41- ECI DIAGONAL B ECI NAELLE': (41.3917, 2.1600),
+    'EN42- ECI MARBELLA ECI NAELLE': (36.5120, -4.8839),
+    'EN46- GRANADA ARABIAL ECI NAELLE': (37.1765, -3.5979),
+    'EN48- MENDEZ ALVARO NAELLE ECI': (40.3965, -3.6780),
+    'EN54- BADAJOZ CONQUISTADORES': (38.8786, -6.9703),
+    'EN62- ECI NAELLE BAHIA DE CADIZ': (36.5297, -6.2927),
+    'EN63- ECI NAELLE ALCALÁ DE HENARES': (40.4820, -3.3640),
+
+    # --- ET ---
+    'ET01- SANCHINARRO ECI TRUCCO': (40.4940, -3.6620),
+    'ET02- SEVILLA NERVION ECI TRUCCO': (37.3831, -5.9719),
+    'ET03- VIGO ECI TRUCCO': (42.2406, -8.7207),
+    'ET04- MALAGA ECI TRUCCO': (36.7213, -4.4214),
+    'ET05- CAMPO NACIONES MADRID ECI TRUCCO': (40.4517, -3.6167),
+    'ET06- VALENCIA-AVDA.FRANCIA ECI TRUCCO': (39.4615, -0.3400),
+    'ET07- ALCALA HENARES ECI TRUCCO': (40.4820, -3.3640),
+    'ET08-(0001) PRECIADOS ECI TRUCCO': (40.4180, -3.7040),
+    'ET09- LAS PALMAS ECI TRUCCO': (28.1297, -15.4457),
+    'ET11- MURCIA ECI TRUCCO': (37.9847, -1.1286),
+    'ET12- PRINCESA ECI TRUCCO': (40.4254, -3.7171),
+    'ET13- TENERIFE ECI TRUCCO': (28.4682, -16.2546),
+    'ET14- SAN JOSE DE VALDERAS CORTE INGLES': (40.3440, -3.7730),
+    'ET15- ARROYOMOLINOS XANADU ECI TRUCCO': (40.2740, -3.9170),
+    'ET16- EL BERCIAL ECI TRUCCO': (40.3175, -3.7317),
+    'ET17- SEVILLA DUQUE ECI TRUCCO': (37.3908, -5.9955),
+    'ET18- SEVILLA SAN JUAN ECI TRUCCO': (37.2830, -6.0090),
+    'ET19- GIJON ECI TRUCCO': (43.5322, -5.6611),
+    'ET20- SALAMANCA ECI TRUCCO': (40.9701, -5.6635),
+    'ET21- CARTAGENA ECI TRUCCO': (37.6257, -0.9966),
+    'ET24- GRANADA GENIL ECI TRUCCO': (37.1765, -3.5979),
+    'ET26- LEON ECI TRUCCO': (42.5987, -5.5671),
+    'ET29- CASTELLANA ECI TRUCCO': (40.4411, -3.6907),
+    'ET30- SOROLLA VALENCIA ECI TRUCCO': (39.4702, -0.3768),
+    'ET31- NUEVO CENTRO VALENCIA ECI TRUCCO': (39.4789, -0.3925),
+    'ET32- VITORIA ECI TRUCCO': (42.8467, -2.6716),
+    'ET33- ECI COSTA LUZ ECI TRUCCO': (36.5297, -6.2927),
+    'ET34- VALLADOLID ZORRILLA ECI TRUCCO': (41.6360, -4.7280),
+    'ET35- VALLADOLID CONSTITUCION ECI TRUCC': (41.6523, -4.7245),
+    'ET37- SANTIAGO ECI TRUCCO': (42.8804, -8.5456),
+    'ET38- GERONA-GIROCENTRE ECI TRUCCO': (41.9810, 2.8249),
+    'ET39- PUERTO VENECIA ECI TRUCCO': (41.6041, -0.8760),
+    'ET41- JAEN ECI TRUCCO': (37.7796, -3.7849),
+    'ET42- MALAGA BAHIA ECI TRUCCO': (36.7213, -4.4214),
+    'ET43- SANTANDER ECI TRUCCO': (43.4623, -3.8099),
+    'ET44- TARRAGONA ECI TRUCCO': (41.1189, 1.2445),
+    'ET45- SABADELL ECI TRUCCO': (41.5463, 2.1086),
+    'ET46- BADAJOZ CONQUISTADORES ECI TRUCCO': (38.8786, -6.9703),
+    'ET47- CAN DRAGO ECI TRUCCO': (41.4410, 2.1835),
+    'ET48- MENDEZ ALVARO ECI TRUCCO': (40.3965, -3.6780),
+    'ET49- ALBACETE ECI TRUCCO': (38.9943, -1.8585),
+    'ET50- JEREZ ECI TRUCCO': (36.6864, -6.1361),
+    'ET51- PARQUESUR ECI TRUCCO': (40.3394, -3.7632),
+    'ET52- VAGUADA ECI TRUCCO': (40.4786, -3.7114),
+    'ET53- CORDOBA ECI TRUCCO': (37.8882, -4.7794),
+    'ET54- CADIZ ECI TRUCCO': (36.5297, -6.2927),
+    'ET55- GRANADA ARABIAL ECI TRUCCO': (37.1765, -3.5979),
+    'ET56- PAMPLONA ECI TRUCCO': (42.8125, -1.6458),
+    'ET57- CASTELLÓN ECI TRUCCO': (39.9864, -0.0513),
+    'ET58- A CORUÑA-RAMON Y CAJAL ECI TRUCCO': (43.3623, -8.4115),
+    'ET61- BAHIA DE ALGECIRAS ECI TRUCCO': (36.1333, -5.4500),
+    'ET62- 7 PALMAS ECI TRUCCO': (28.1081, -15.4565),
+    'ET64- POZUELO ECI TRUCCO': (40.4361, -3.8136),
+    'ET66- CORDOBA TEJARES ECI TRUCCO': (37.8882, -4.7794),
+    'ET68- AVILES ECI TRUCCO': (43.5560, -5.9247),
+    'ET75- EL EJIDO TRUCCO ECI': (36.7763, -2.8146),
+
+    # --- F / P / R ---
+    'F087 CHAVES': (41.7403, -7.4689),
+    'F095  CIUDAD REAL': (38.9863, -3.9291),
+    'F097 BADAJOZ': (38.8786, -6.9703),
+    'P030 PAMPLONA': (42.8125, -1.6458),
+    'P032 FUENCARRAL': (40.4297, -3.7036),
+    'R010 ARTURO': (40.4483, -3.6900),
+    'R013 BILBAO': (43.2630, -2.9350),
+    'R018 PALACIO DE HIELO': (40.4631, -3.6370),
+    'R025 CASTELLANA': (40.4411, -3.6907),
+    'R026 JORGE JUAN': (40.4246, -3.6820),
+    'R028 PRINCESA': (40.4254, -3.7171)
+}
+
+# Misma información como tabla, para asignar coordenadas con un merge en lugar de un lookup por fila
+COORDENADAS_TIENDAS = pd.DataFrame(
+    [(tienda, lat, lon) for tienda, (lat, lon) in TIENDA_A_COORD.items()],
+    columns=['Tienda', 'lat', 'lon']
+)
 
 COL_ONLINE = '#2ca02c'   # verde fuerte
 COL_OTRAS = '#ff7f0e'    # naranja
 
-def custom_sort_key(talla):
+TALLAS_LETRA = pd.Index(['XS', 'S', 'M', 'L', 'XL', 'XXL'])
+TALLAS_UNICAS = ['U', 'ÚNICA', 'UNICA', 'TU']
+
+def build_talla_order(tallas):
     """
-    Clave de ordenación personalizada para tallas.
-    Prioriza: 1. Tallas numéricas, 2. Tallas de letra estándar, 3. Tallas únicas, 4. Resto.
+    Devuelve las tallas únicas ordenadas por prioridad: 1. Tallas numéricas, 2. Tallas de letra
+    estándar, 3. Tallas únicas, 4. Resto (alfabético), clasificándolas en bloque con NumPy.
+    El orden se memoriza por conjunto de tallas, así que los reruns no vuelven a ordenar.
     """
-    talla_str = str(talla).upper().strip()
-    
-    # Prioridad 1: Tallas numéricas (e.g., '36', '38')
-    if talla_str.isdigit():
-        return (0, int(talla_str))
-    
-    # Prioridad 2: Tallas de letra estándar
-    size_order = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
-    if talla_str in size_order:
-        return (1, size_order.index(talla_str))
-        
-    # Prioridad 3: Tallas únicas
-    if talla_str in ['U', 'ÚNICA', 'UNICA', 'TU']:
-        return (2, talla_str)
-        
-    # Prioridad 4: Resto, ordenado alfabéticamente
-    return (3, talla_str)
+    unicas = pd.unique(np.asarray(tallas, dtype=object))
+    if len(unicas) == 0:
+        return []
+    unicas = tuple(unicas.tolist())
+    return list(_ordenar_tallas_unicas(unicas, tuple(type(talla) for talla in unicas)))
 
-def setup_streamlit_styles():
-    """Configurar estilos de Streamlit"""
-    st.markdown("""
+def ordenar_por_talla(df, columna='Talla'):
+    """
+    Ordena las filas de df por talla usando un Categorical ordenado con build_talla_order:
+    la comparación se hace sobre códigos enteros, sin una clave Python por fila.
+    """
+    orden = build_talla_order(df[columna])
+    return df.sort_values(columna, key=lambda x: pd.Series(pd.Categorical(x, categories=orden, ordered=True), index=x.index))
+
+def categoria_tallas(serie):
+    """
+    Convierte la columna de tallas en category ordenada según build_talla_order: sort_values, sort_index
+    y groupby siguen el orden de tallas comparando códigos, sin clave Python.
+    """
+    serie = serie.astype('category')
+    return serie.cat.reorder_categories(build_talla_order(serie.cat.categories), ordered=True)
+
+@lru_cache(maxsize=256)
+def _ordenar_tallas_unicas(unicas, tipos):
+    """
+    Ordena una tupla de tallas ya deduplicadas (ver build_talla_order).
+    tipos solo forma parte de la clave de lru_cache: 38 y 38.0 son la misma clave pero no se ordenan igual.
+    """
+    unicas = np.array(unicas, dtype=object)
+    norm = np.char.strip(np.char.upper(unicas.astype(str)))
+
+    es_num = np.char.isdigit(norm)
+    es_letra = ~es_num & np.isin(norm, TALLAS_LETRA)
+    es_unica = ~es_num & np.isin(norm, TALLAS_UNICAS)
+    es_resto = ~(es_num | es_letra | es_unica)
+
+    idx_num = np.flatnonzero(es_num)
+    idx_num = idx_num[np.argsort(norm[idx_num].astype(np.int64), kind='stable')]
+    idx_letra = np.flatnonzero(es_letra)
+    idx_letra = idx_letra[np.argsort(TALLAS_LETRA.get_indexer(norm[idx_letra]), kind='stable')]
+    idx_unica = np.flatnonzero(es_unica)
+    idx_unica = idx_unica[np.argsort(norm[idx_unica], kind='stable')]
+    idx_resto = np.flatnonzero(es_resto)
+    idx_resto = idx_resto[np.argsort(norm[idx_resto], kind='stable')]
+
+    return tuple(unicas[np.concatenate([idx_num, idx_letra, idx_unica, idx_resto])].tolist())
+
+# Hoja de estilos del dashboard: se compacta una sola vez al importar el módulo.
+# Debe emitirse en cada rerun (Streamlit elimina los elementos no re-renderizados),
+# así que lo que se reduce es el tamaño del mensaje, no el número de llamadas.
+DASHBOARD_CSS = re.sub(r"\s+", " ", """
     <style>
     .dashboard-container {
         border: 1px solid #e5e7eb;
@@ -176,18 +321,110 @@ def setup_streamlit_styles():
         padding-top: 0;
     }
     </style>
-    """, unsafe_allow_html=True)
+""").strip()
+
+def setup_streamlit_styles():
+    """Configurar estilos de Streamlit"""
+    st.markdown(DASHBOARD_CSS, unsafe_allow_html=True)
+
+KPI_GROUP_TEMPLATE = (
+    '<div style="border: 1px solid #e5e7eb; border-radius: 8px; padding: 15px; margin-bottom: 15px; background-color: white;">'
+    '<div style="color: #666666; font-size: 16px; font-weight: 600; margin-bottom: 10px; padding-bottom: 5px; border-bottom: 1px solid #e5e7eb;">{title}</div>'
+    '<div style="display: flex; justify-content: space-between; gap: 15px;">{items}</div>'
+    '</div>'
+)
+KPI_ITEM_TEMPLATE = (
+    '<div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">'
+    '<p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">{label}</p>'
+    '<p style="color: {color}; font-size: 24px; font-weight: bold; margin: 0;">{value}</p>'
+    '</div>'
+)
+
+ZONA_KPI_TEMPLATE = (
+    '<div class="kpi-group">'
+    '<div class="kpi-group-title">{zona}</div>'
+    '<div class="kpi-row">'
+    '<div class="kpi-item">'
+    '<p class="small-font">Mejor Tienda</p>'
+    '<p class="metric-value">{mejor_tienda}</p>'
+    '<p class="small-font">{mejor_cantidad:,.0f} uds</p>'
+    '<p class="small-font" style="color:#059669;">{mejor_beneficio:,.2f}€</p>'
+    '</div>'
+    '<div class="kpi-item">'
+    '<p class="small-font">Peor Tienda</p>'
+    '<p class="metric-value">{peor_tienda}</p>'
+    '<p class="small-font">{peor_cantidad:,.0f} uds ({peor_pct}% vs media)</p>'
+    '<p class="small-font" style="color:#dc2626;">{peor_beneficio:,.2f}€</p>'
+    '</div>'
+    '</div>'
+    '</div>'
+)
+
+def render_kpi_group(title, items):
+    """
+    Genera el HTML de un grupo de KPIs.
+
+    Args:
+        title (str): Título del grupo.
+        items (list): Tuplas (etiqueta, valor ya formateado, color del valor).
+
+    Returns:
+        str: HTML del grupo, listo para st.markdown(..., unsafe_allow_html=True).
+    """
+    items_html = "".join(
+        KPI_ITEM_TEMPLATE.format(label=label, value=value, color=color) for label, value, color in items
+    )
+    return KPI_GROUP_TEMPLATE.format(title=title, items=items_html)
 
 def viz_title(text):
     """Función unificada para títulos de visualizaciones"""
     st.markdown(f'<h3 class="viz-title">{text}</h3>', unsafe_allow_html=True)
 
+def columnas_enteras(columnas):
+    """column_config que muestra las columnas como enteros con separador de miles (formato en el navegador, sin Styler)"""
+    return {str(col): st.column_config.NumberColumn(format='localized') for col in columnas}
+
 def titulo(text):
     st.markdown(f"<h4 style='text-align:left;color:#666666;margin:0;padding:0;font-size:20px;font-weight:bold;'>{text}</h4>", unsafe_allow_html=True)
 
 def subtitulo(text):
     st.markdown(f"<h5 style='text-align:left;color:#666666;margin:0;padding:0;font-size:22px;font-weight:bold;'>{text}</h5>", unsafe_allow_html=True)
 
+def get_tiendas_unicas(df, columna_tienda='Tienda'):
+    """
+    Devuelve los nombres de tienda distintos de la columna.
+    Con dtype category basta con las categorías, sin recorrer toda la columna.
+    """
+    columna = df[columna_tienda]
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        return columna.cat.categories
+    return pd.Index(columna.dropna().unique())
+
+def valores_presentes(columna):
+    """
+    Lista ordenada de los valores (no nulos) que aparecen en la columna.
+    Con dtype category se cuentan los códigos en lugar de deduplicar los textos.
+    """
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        categorias = columna.cat.categories
+        presentes = np.bincount(columna.cat.codes.to_numpy() + 1, minlength=len(categorias) + 1)[1:] > 0
+        return sorted(categorias[presentes])
+    return sorted(pd.unique(columna.dropna().to_numpy()))
+
+def get_tiendas_presentes(df, columna_tienda='Tienda'):
+    """Lista ordenada de las tiendas con al menos una fila en el DataFrame."""
+    return valores_presentes(df[columna_tienda])
+
+def mascara_tiendas(columna, tiendas):
+    """
+    Máscara booleana (ndarray) de las filas cuya tienda está en `tiendas`.
+    Con dtype category se evalúa sobre las categorías y se expande con los códigos.
+    """
+    if isinstance(columna.dtype, pd.CategoricalDtype):
+        en_conjunto = np.append(columna.cat.categories.isin(tiendas), False)
+        return en_conjunto[columna.cat.codes.to_numpy()]
+    return columna.isin(tiendas).to_numpy()
+
 def identificar_tiendas_naelle(df, columna_tienda='Tienda'):
     """
     Devuelve una lista de tiendas que incluyen la palabra 'NAELLE' en su nombre.
@@ -203,10 +440,10 @@ def identificar_tiendas_naelle(df, columna_tienda='Tienda'):
         return []
     
     # Filtrar tiendas que contienen 'NAELLE' (mayúsculas o minúsculas)
-    tiendas_naelle = df[columna_tienda].dropna().unique()
-    tiendas_naelle = [t for t in tiendas_naelle if 'NAELLE' in t.upper()]
+    tiendas_naelle = get_tiendas_unicas(df, columna_tienda).to_numpy(dtype=str)
+    mask = np.char.find(np.char.upper(tiendas_naelle), 'NAELLE') >= 0
     
-    return sorted(tiendas_naelle)
+    return sorted(tiendas_naelle[mask].tolist())
 
 def identificar_tiendas_italia(df, columna_tienda='Tienda'):
     """
@@ -223,15 +460,161 @@ def identificar_tiendas_italia(df, columna_tienda='Tienda'):
         return []
     
     # Filtrar tiendas que contienen 'COIN' (mayúsculas o minúsculas)
-    tiendas_it = df[columna_tienda].dropna().unique()
-    tiendas_it = [t for t in tiendas_it if 'COIN' in t.upper()]
+    tiendas_it = get_tiendas_unicas(df, columna_tienda).to_numpy(dtype=str)
+    mask = np.char.find(np.char.upper(tiendas_it), 'COIN') >= 0
     
-    return sorted(tiendas_it)
+    return sorted(tiendas_it[mask].tolist())
+
+@st.cache_data(show_spinner=False)
+def clasificar_tiendas(tiendas):
+    """
+    Clasifica las tiendas por marca / país en una sola llamada cacheada.
+
+    Args:
+        tiendas (tuple): Nombres de tienda distintos y ordenados (ver get_tiendas_unicas); tupla para
+            que st.cache_data pueda hashearlos como clave.
+
+    Returns:
+        dict: Listas ordenadas 'naelle', 'italia' y 'trucco' (el resto).
+    """
+    df_tiendas = pd.DataFrame({'Tienda': list(tiendas)})
+    naelle = identificar_tiendas_naelle(df_tiendas)
+    italia = identificar_tiendas_italia(df_tiendas)
+    otras = set(naelle) | set(italia)
+    trucco = sorted(t for t in df_tiendas['Tienda'].dropna() if t not in otras)
+    return {'naelle': naelle, 'italia': italia, 'trucco': trucco}
+
+# Ciudades reconocidas en el nombre de las tiendas italianas, por orden de prioridad
+# (las más específicas primero: MILANO5GIORNATE y MILANOCANTORE antes que MILANO)
+CIUDADES_ITALIA = [
+    'BERGAMO', 'VARESE', 'BARICASAMASSIMA', 'MILANO5GIORNATE', 'ROMACINECITTA', 'GENOVA',
+    'SASSARI', 'CATANIA', 'CAGLIARI', 'LECCE', 'MILANOCANTORE', 'MESTRE', 'PADOVA',
+    'FIRENZE', 'ROMASANGIOVANNI', 'MILANO', 'TRUCCOONLINEB2C'
+]
+
+def ciudad_tiendas_italia(tiendas):
+    """
+    Deduce la ciudad de cada tienda italiana a partir de su nombre, con búsquedas de texto vectorizadas.
+    Si el nombre contiene varias ciudades conocidas, gana la primera de CIUDADES_ITALIA.
+
+    Args:
+        tiendas (list): Nombres de tienda distintos.
+
+    Returns:
+        pd.Series: Ciudad indexada por tienda (para usar con Series.map). Si no aparece ninguna ciudad
+        conocida, se toma lo que sigue al prefijo "I###COIN" o, en último caso, el nombre sin prefijos.
+    """
+    tiendas = pd.Series(tiendas, dtype=object).astype(str)
+    nombres = tiendas.str.upper()
+    # Ciudades en orden de prioridad: cada una solo se asigna a las tiendas que aún no tienen ciudad
+    ciudad = pd.Series(np.nan, index=tiendas.index, dtype=object)
+    for nombre_ciudad in CIUDADES_ITALIA:
+        ciudad[ciudad.isna() & nombres.str.contains(nombre_ciudad, regex=False)] = nombre_ciudad
+    ciudad = ciudad.replace({'TRUCCOONLINEB2C': 'ONLINE'})
+    ciudad = ciudad.fillna(tiendas.str.extract(r'I\d{3}COIN([A-Z]+)', expand=False))
+    sin_prefijos = (
+        nombres.str.replace(r'I3(?:0[1-69]|1[4-9]|2[01])COIN', '', regex=True)
+        .str.replace('(TRUCCO)', '', regex=False)
+    )
+    ciudad = ciudad.fillna(sin_prefijos)
+    return pd.Series(ciudad.to_numpy(), index=tiendas.to_numpy())
+
+def parse_fechas(serie, formato='%d/%m/%Y'):
+    """
+    Convierte una columna de fechas a datetime parseando cada valor distinto una sola vez.
+
+    Args:
+        serie (pd.Series): Columna con fechas (texto o datetime).
+        formato (str): Formato esperado de las fechas.
+
+    Returns:
+        pd.Series: Columna datetime; los valores no reconocidos quedan como NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+
+    fechas = pd.to_datetime(serie, format=formato, errors='coerce', cache=True)
+
+    # Valores con otro formato: parsear solo los únicos y mapear el resultado.
+    # ISO (YYYY-MM-DD) primero, para que dayfirst no intercambie su mes y su día.
+    pendientes = fechas.isna() & serie.notna()
+    if pendientes.any():
+        valores = pd.Series(pd.unique(serie[pendientes]), dtype=object)
+        convertidos = pd.to_datetime(valores, format='ISO8601', errors='coerce')
+        resto = convertidos.isna()
+        if resto.any():
+            convertidos[resto] = pd.to_datetime(valores[resto], format='mixed', dayfirst=True, errors='coerce')
+        parser = dict(zip(valores, convertidos))
+        fechas[pendientes] = serie[pendientes].map(parser)
+
+    return fechas
+
+def limpiar_espacios(serie):
+    """
+    Quita los espacios de los extremos en los valores de texto de una columna.
+    Los nulos y los valores no textuales (p. ej. tallas numéricas) se dejan tal cual.
+    """
+    if not pd.api.types.is_string_dtype(serie.dtype):
+        return serie
+    return serie.str.strip().fillna(serie)
+
+def formatear_mes(fechas):
+    """
+    Convierte una columna datetime en el texto 'YYYY-MM' de su mes.
+    Se factoriza sobre los enteros datetime64[M] y solo se formatea cada mes distinto.
+    Equivale a fechas.dt.to_period('M').astype(str); los NaT quedan como NaN.
+    """
+    codigos, meses = pd.factorize(fechas.to_numpy(dtype='datetime64[M]'))
+    # Un NaN al final: los NaT (código -1) indexan esa posición, también si no hay ningún mes válido
+    textos = np.append(pd.Index(meses).strftime('%Y-%m').to_numpy(dtype=object), np.nan)
+    return pd.Series(textos[codigos], index=fechas.index)
+
+def reducir_a_int32(serie):
+    """
+    Devuelve la columna de unidades como int32 si todos sus valores son enteros que caben en ese tipo;
+    si no (decimales, nulos o valores enormes), la deja como estaba. Los totales de groupby/sum salen en int64.
+    """
+    valores = serie.to_numpy(dtype='float64')
+    info = np.iinfo(np.int32)
+    if np.array_equal(valores, np.trunc(valores)) and (len(valores) == 0 or (valores.min() >= info.min and valores.max() <= info.max)):
+        return pd.Series(valores.astype(np.int32), index=serie.index, name=serie.name)
+    return serie
+
+def dataframe_fingerprint(df):
+    """
+    Huella ligera del contenido de un DataFrame para usar como clave de caché.
+    Se calcula una vez en el preprocesado y se guarda en df.attrs junto al id() del objeto:
+    pandas copia attrs a los DataFrames derivados (filtros, copias, asignaciones), que no
+    deben heredar la huella de su origen, así que solo vale para el objeto que la guardó.
+    """
+    huella = df.attrs.get('huella')
+    if huella is not None and df.attrs.get('huella_id') == id(df) and huella[0] == len(df):
+        return huella
+    huella = (len(df), int(pd.util.hash_pandas_object(df, index=True).sum()))
+    fijar_huella(df, huella)
+    return huella
+
+def fijar_huella(df, huella):
+    """Guarda en df.attrs una huella ya conocida, ligada a este objeto concreto"""
+    df.attrs['huella'] = huella
+    df.attrs['huella_id'] = id(df)
+
+@st.cache_data
+def compute_filter_indices(_df_ventas, huella, fecha_inicio, fecha_fin, tiendas=None):
+    """
+    Posiciones de las filas dentro del rango de fechas (y de las tiendas indicadas).
+    El DataFrame no se hashea: la clave de caché es la huella más los parámetros del filtro.
+    """
+    fechas = _df_ventas['Fecha venta']
+    mask = (fechas >= pd.to_datetime(fecha_inicio)) & (fechas <= pd.to_datetime(fecha_fin))
+    if tiendas is not None:
+        mask &= _df_ventas['Tienda'].isin(tiendas)
+    return np.flatnonzero(mask.to_numpy())
 
 
 def aplicar_filtros(df_ventas, df_traspasos):
-    if not pd.api.types.is_datetime64_any_dtype(df_ventas['Fecha venta']):
-        df_ventas['Fecha venta'] = pd.to_datetime(df_ventas['Fecha venta'], format='%d/%m/%Y', errors='coerce')
+    # Las fechas llegan ya convertidas desde preprocess_*_data (cacheado); aquí solo es un fallback
+    df_ventas['Fecha venta'] = parse_fechas(df_ventas['Fecha venta'])
     fecha_min, fecha_max = df_ventas['Fecha venta'].min(), df_ventas['Fecha venta'].max()
 
     fecha_inicio, fecha_fin = st.sidebar.date_input(
@@ -247,17 +630,19 @@ def aplicar_filtros(df_ventas, df_traspasos):
             return df_ventas.iloc[0:0], df_traspasos.iloc[0:0], False, []
         return df_ventas.iloc[0:0], False, []
 
-    df_ventas_filtrado = df_ventas[(df_ventas['Fecha venta'] >= pd.to_datetime(fecha_inicio)) &
-                     (df_ventas['Fecha venta'] <= pd.to_datetime(fecha_fin))]
+    huella = dataframe_fingerprint(df_ventas)
+    df_ventas_filtrado = df_ventas.take(compute_filter_indices(df_ventas, huella, fecha_inicio, fecha_fin))
     # Listado completo de tiendas
-    tiendas = sorted(df_ventas_filtrado['Tienda'].dropna().unique())
+    tiendas = get_tiendas_presentes(df_ventas_filtrado)
 
-    # Listas de tiendas por marca / tipo
-    TIENDAS_NAELLE = identificar_tiendas_naelle(df_ventas)
+    # Listas de tiendas por marca / tipo (clasificación cacheada por conjunto de tiendas)
+    clasificacion = clasificar_tiendas(tuple(sorted(get_tiendas_unicas(df_ventas))))
+    TIENDAS_NAELLE = set(clasificacion['naelle'])
     tiendas_naelle = [t for t in tiendas if t in TIENDAS_NAELLE]
-    TIENDAS_ITALIA = identificar_tiendas_italia(df_ventas)
+    TIENDAS_ITALIA = set(clasificacion['italia'])
     tiendas_extranjeras = [t for t in tiendas if t in TIENDAS_ITALIA]
-    tiendas_trucco = [t for t in tiendas if t not in tiendas_naelle + tiendas_extranjeras]
+    TIENDAS_TRUCCO = set(clasificacion['trucco'])
+    tiendas_trucco = [t for t in tiendas if t in TIENDAS_TRUCCO]
 
     # Opciones del filtro y mapping a tiendas
     opciones_tienda = [
@@ -289,25 +674,25 @@ def aplicar_filtros(df_ventas, df_traspasos):
         tiendas_especificas = False
 
     # Filtrar dataframe principal
-    df_ventas_filtrado = df_ventas_filtrado[df_ventas_filtrado['Tienda'].isin(tienda_seleccionada)]
+    df_ventas_filtrado = df_ventas.take(
+        compute_filter_indices(df_ventas, huella, fecha_inicio, fecha_fin, tuple(tienda_seleccionada))
+    )
+    # Huella del resultado derivada de la original y del filtro: las funciones cacheadas
+    # por huella no necesitan volver a hashear el DataFrame filtrado en cada rerun.
+    # La clave es el sha1 de la tupla del filtro (no hash(), con colisiones posibles): un texto, que
+    # st.dataframe puede serializar junto a attrs, a diferencia de las fechas de la tupla
+    clave_filtro = repr((huella, fecha_inicio, fecha_fin, tuple(tienda_seleccionada)))
+    fijar_huella(df_ventas_filtrado, (
+        len(df_ventas_filtrado),
+        hashlib.sha1(clave_filtro.encode('utf-8')).hexdigest()
+    ))
 
     # Filtrar traspasos si existe
     if df_traspasos is not None:
-        df_traspasos_filtrado = df_traspasos.copy()
-        
-        # Asegurar que las tiendas de traspasos estén limpias de espacios para comparación correcta
-        if 'Tienda' in df_traspasos_filtrado.columns:
-            df_traspasos_filtrado['Tienda'] = df_traspasos_filtrado['Tienda'].astype(str).str.strip()
-        
-        # Convertir fechas de forma flexible
-        for fmt in ['%d/%m/%Y', None]:
-            try:
-                df_traspasos_filtrado['Fecha enviado'] = pd.to_datetime(df_traspasos_filtrado['Fecha enviado'], format=fmt, errors='coerce')
-                break
-            except:
-                continue
-        if 'Tienda' in df_traspasos_filtrado.columns:
-            df_traspasos_filtrado = df_traspasos_filtrado[df_traspasos_filtrado['Tienda'].isin(tienda_seleccionada)]
+        # Tiendas ya limpias y fechas ya convertidas en preprocess_traspasos_data (cacheado): sin copia
+        df_traspasos_filtrado = df_traspasos
+        if 'Tienda' in df_traspasos.columns:
+            df_traspasos_filtrado = df_traspasos.loc[mascara_tiendas(df_traspasos['Tienda'], tienda_seleccionada)]
         return df_ventas_filtrado, df_traspasos_filtrado, tiendas_especificas, tienda_seleccionada
 
     return df_ventas_filtrado, tiendas_especificas, tienda_seleccionada
@@ -340,41 +725,6 @@ def create_resizable_chart(chart_key, chart_function):
     st.markdown(f'<div class="chart-container" style="height: {height}px;">', unsafe_allow_html=True)
     chart_function(height)
     st.markdown('</div>', unsafe_allow_html=True)
-def plot_bar(df, x, y, title, palette='Greens', rotate_x=30, color=None):
-    fig, ax = plt.subplots(figsize=(10, 6))
-    if color:
-        sns.barplot(x=x, y=y, data=df, color=color, ax=ax)
-    else:
-        # Normalizar los valores para el degradado
-        norm_values = (df[y] - df[y].min()) / (df[y].max() - df[y].min())
-        colors = [COLOR_GRADIENT[int(v * (len(COLOR_GRADIENT)-1))] if not pd.isna(v) else COLOR_GRADIENT[0] for v in norm_values]
-        
-        sns.barplot(x=x, y=y, data=df, palette=colors, ax=ax)
-    
-    ax.set_title(title, fontsize=16, fontweight='bold', color="#111827", loc="left", pad=0)
-    ax.set_xlabel(x, fontsize=13)
-    ax.set_ylabel(y, fontsize=13)
-    plt.xticks(rotation=rotate_x, ha='right', fontsize=11)
-    plt.yticks(fontsize=11)
-    ax.grid(False)
-    ax.set_axisbelow(True)
-    sns.despine()
-    
-    # Ajustar valores sobre las barras
-    for bar in ax.patches:
-        value = bar.get_height()
-        ax.text(
-            bar.get_x() + bar.get_width() / 2,
-            value + (0.01 * value),
-            f'{int(value)}',
-            ha='center',
-            va='bottom',
-            fontsize=10,
-            color='#333'
-        )
-    
-    plt.tight_layout(pad=0.5)
-    st.pyplot(fig, use_container_width=True)
 
 def viz_container(title, render_function):
     """Contenedor para visualizaciones"""
@@ -383,6 +733,56 @@ def viz_container(title, render_function):
     render_function()
     st.markdown('</div>', unsafe_allow_html=True)
 
+def render_entrada_almacen_tema(tema, agregados):
+    """
+    Panel "Entrada Almacén" de un tema: gráfico enviado vs ventas por talla y tabla de entradas por mes y talla.
+
+    Args:
+        tema (str): Tema_temporada a mostrar (p. ej. "T_OI25").
+        agregados (dict): Cálculos compartidos por todos los temas, preparados una vez en mostrar_dashboard.
+    """
+    st.subheader(f"Entrada Almacén - {tema}")
+
+    temporada_comparacion = agregados['tema_a_temporada'].get(tema)
+    if tema in agregados['temas_con_ventas'] and tema in agregados['temas_con_entradas']:
+        # Ventas por talla del tema (cacheadas por huella de ventas, temporada y códigos del tema)
+        ventas_por_talla = calculate_ventas_talla_tema(
+            agregados['ventas'],
+            agregados['huella_ventas'],
+            temporada_comparacion,
+            tuple(agregados['codigos_por_tema'][tema])
+        )
+        if not ventas_por_talla.empty:
+            enviado_por_talla = agregados['enviado_talla_por_tema'].loc[tema]
+            # Índice común de tallas ya ordenado: el reindex alinea las dos series sin merge ni sort posterior
+            tallas = build_talla_order(enviado_por_talla.index.union(ventas_por_talla.index))
+            datos_comparacion = pd.DataFrame({
+                'Talla': tallas,
+                'Cantidad pedida': enviado_por_talla.reindex(tallas, fill_value=0).to_numpy(),
+                'Cantidad': ventas_por_talla.reindex(tallas, fill_value=0).to_numpy()
+            })
+
+            # Sin cantidades no hay nada que dibujar; la figura se cachea por datos y título
+            if datos_comparacion[['Cantidad pedida', 'Cantidad']].to_numpy().any():
+                fig = build_enviado_ventas_figure(datos_comparacion, f'Enviado vs Ventas - {tema} ({temporada_comparacion})')
+                st.plotly_chart(fig, use_container_width=True)
+
+    # Entradas por mes y talla de este tema: corte de la tabla pivot común a todos los temas,
+    # quedándose solo con las tallas que tiene el tema
+    if tema in agregados['temas_con_entradas']:
+        tallas_orden = build_talla_order(agregados['enviado_talla_por_tema'].loc[tema].index)
+        tabla_pivot = agregados['entradas_mes_talla'].loc[tema, tallas_orden].round(0)
+        st.dataframe(
+            tabla_pivot,
+            use_container_width=True,
+            hide_index=False,
+            column_config=columnas_enteras(tabla_pivot.columns)
+        )
+        total_temp = tabla_pivot.sum().sum()
+        st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
+    else:
+        st.info(f"No hay datos para el tema {tema}")
+
 def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
     # Asegurar que pandas esté disponible en el scope local
     import pandas as pd
@@ -390,6 +790,10 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
     
     # Use cached preprocessing for better performance
     df_ventas = preprocess_ventas_data(df_ventas)
+    # La caché devuelve una copia nueva con el mismo contenido que se hasheó en el preprocesado:
+    # se liga esa huella al objeto devuelto en vez de volver a hashear las ventas en cada rerun
+    if 'huella' in df_ventas.attrs:
+        fijar_huella(df_ventas, df_ventas.attrs['huella'])
     df_productos = preprocess_productos_data(df_productos)
     df_traspasos = preprocess_traspasos_data(df_traspasos)
     
@@ -417,42 +821,46 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         st.warning("No hay datos para mostrar con los filtros seleccionados.")
         return
 
-    # Merge Precio Coste from df_productos into df_ventas using Código único
-    df_ventas_precios = df_ventas.merge(
-        df_productos[['Código único', 'Precio Coste']],
-        on='Código único',
-        how='left',
-        suffixes=('', '_producto')
-    )
+    # Precio Coste from df_productos via dict lookup on Código único (no merge/copy per rerun)
+    precio_map = build_precio_map(df_productos)
+    precio_coste = df_ventas['Código único'].map(precio_map)
     # Prefer Precio Coste from df_productos if available
-    if 'Precio Coste_producto' in df_ventas_precios.columns:
-        df_ventas_precios['Precio Coste'] = df_ventas_precios['Precio Coste_producto'].combine_first(df_ventas_precios['Precio Coste'])
-        df_ventas_precios = df_ventas_precios.drop(columns=['Precio Coste_producto'])
+    if 'Precio Coste' in df_ventas.columns:
+        precio_coste = precio_coste.fillna(df_ventas['Precio Coste'])
+    df_ventas_precios = df_ventas.assign(**{'Precio Coste': precio_coste})
 
     if seccion == "Resumen General":
         try:
             # Mostrar estadísticas adicionales optimizadas
             st.info(f" Este análisis no considera las tiendas {tiendas_a_eliminar}, con el objetivo de optimizar la calidad de los resultados.")
             # Qué tiene el análisis general
-            df_ventas_reales = df_ventas[df_ventas['Familia'] != 'GR.ART.FICTICIO']
-            # Número familias únicas
-            num_familias_reales = df_ventas_reales['Familia'].nunique()
-
-            # Número tiendas únicas
-            num_tiendas_reales = df_ventas_reales['Tienda'].nunique()
-
-            # Número temporadas únicas 
-            num_temporadas_reales = df_ventas_reales['Temporada'].nunique()
+            # Máscara GR.ART.FICTICIO calculada una vez; se reutiliza en los KPIs de abajo
+            es_ficticio = (df_ventas['Familia'] == 'GR.ART.FICTICIO').to_numpy()
+            # Número de familias, tiendas y temporadas únicas (una sola llamada sobre las ventas reales)
+            unicos_reales = df_ventas.loc[~es_ficticio, ['Familia', 'Tienda', 'Temporada']].nunique()
+            num_familias_reales = unicos_reales['Familia']
+            num_tiendas_reales = unicos_reales['Tienda']
+            num_temporadas_reales = unicos_reales['Temporada']
 
             # Número transacciones
             num_transacciones = len(df_ventas)
 
             # Calcular KPIs separando GR.ART.FICTICIO del resto
+            # Una sola agregación por (ficticio, signo de la cantidad, online) en lugar de filtrar
+            # el DataFrame una vez por KPI; todos los importes se leen de este resumen
+            signo_cantidad = np.sign(df_ventas['Cantidad'].to_numpy()).astype('int8')
+            es_online = mascara_tiendas(df_ventas['Tienda'], TIENDAS_ONLINE)
+            resumen_kpis = df_ventas.groupby([es_ficticio, signo_cantidad, es_online], observed=True).agg(
+                beneficio=('Beneficio', 'sum'),
+                tiendas=('Código Tienda', 'nunique')
+            )
+            resumen_kpis.index.names = ['ficticio', 'signo', 'online']
+            beneficio_por_signo = resumen_kpis['beneficio'].groupby(level=['ficticio', 'signo']).sum()
 
             # 1. KPIs EXCLUYENDO GR.ART.FICTICIO
             # Ventas brutas = devoluciones + ventas
-            ventas_positivas_reales = df_ventas_reales[df_ventas_reales['Cantidad'] > 0]['Beneficio'].sum()
-            devoluciones_reales = abs(df_ventas_reales[df_ventas_reales['Cantidad'] < 0]['Beneficio'].sum())
+            ventas_positivas_reales = beneficio_por_signo.get((False, 1), 0)
+            devoluciones_reales = abs(beneficio_por_signo.get((False, -1), 0))
             total_ventas_brutas_reales = ventas_positivas_reales + devoluciones_reales
             
             # Total neto = solo ventas positivas
@@ -463,152 +871,51 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             
             # 2. KPIs SOLO GR.ART.FICTICIO
-            df_ventas_ficticio = df_ventas[df_ventas['Familia'] == 'GR.ART.FICTICIO']
-            
-            ventas_positivas_ficticio = df_ventas_ficticio[df_ventas_ficticio['Cantidad'] > 0]['Beneficio'].sum()
-            devoluciones_ficticio = abs(df_ventas_ficticio[df_ventas_ficticio['Cantidad'] < 0]['Beneficio'].sum())
+            ventas_positivas_ficticio = beneficio_por_signo.get((True, 1), 0)
+            devoluciones_ficticio = abs(beneficio_por_signo.get((True, -1), 0))
             total_ventas_brutas_ficticio = ventas_positivas_ficticio + devoluciones_ficticio
             total_neto_ficticio = ventas_positivas_ficticio
             tasa_devolucion_ficticio = (devoluciones_ficticio / total_neto_ficticio) * 100 if total_neto_ficticio > 0 else 0
             
-            # 3. ANÁLISIS POR TIPO DE TIENDA (excluyendo GR.ART.FICTICIO)
-            # Definir tiendas online específicas
-            tiendas_online_list = [
-                'ECI NAELLE ONLINE',
-                'ECI ONLINE GESTION', 
-                'ET0N ECI ONLINE',
-                'NAELLE ONLINE B2C',
-                'OUTLET TRUCCO ONLINE B2O',
-                'TRUCCO ONLINE B2C'
-            ]
-            
-            # Filtrar solo ventas positivas y excluir GR.ART.FICTICIO
-            df_ventas_analisis = df_ventas[
-                (df_ventas['Cantidad'] > 0) & 
-                (df_ventas['Familia'] != 'GR.ART.FICTICIO')
-            ]
-            
-            # Identificar tiendas online vs físicas
-            tiendas_online_mask = df_ventas_analisis['Tienda'].isin(tiendas_online_list)
-            ventas_fisicas = df_ventas_analisis[~tiendas_online_mask]
-            ventas_online = df_ventas_analisis[tiendas_online_mask]
-            
-            # Calcular KPIs por tipo de tienda
-            ventas_fisicas_dinero = ventas_fisicas['Beneficio'].sum()
-            ventas_online_dinero = ventas_online['Beneficio'].sum()
-            tiendas_fisicas_count = ventas_fisicas['Código Tienda'].nunique()
-            tiendas_online_count = ventas_online['Código Tienda'].nunique()
-            
-            # Alcance Análisis 
-            st.markdown("""
-                <div style="border: 1px solid #e5e7eb; border-radius: 8px; padding: 15px; margin-bottom: 15px; background-color: white;">
-                    <div style="color: #666666; font-size: 16px; font-weight: 600; margin-bottom: 10px; padding-bottom: 5px; border-bottom: 1px solid #e5e7eb;">
-                        Alcance del Análisis (Excluyendo GR.ART.FICTICIO)
-                    </div>
-                    <div style="display: flex; justify-content: space-between; gap: 15px;">
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Familias</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{}</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Tiendas</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{}</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Temporadas</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{}</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Transacciones (Sin excluir GR.ART.FICTICIO)</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{}</p>
-                        </div>
-                    </div>
-                </div>
-            """.format(num_familias_reales, num_tiendas_reales, num_temporadas_reales, num_transacciones), unsafe_allow_html=True)
+            # 3. ANÁLISIS POR TIPO DE TIENDA (solo ventas positivas, excluyendo GR.ART.FICTICIO)
+            ventas_fisicas_dinero = resumen_kpis['beneficio'].get((False, 1, False), 0)
+            ventas_online_dinero = resumen_kpis['beneficio'].get((False, 1, True), 0)
+            tiendas_fisicas_count = resumen_kpis['tiendas'].get((False, 1, False), 0)
+            tiendas_online_count = resumen_kpis['tiendas'].get((False, 1, True), 0)
+            
+            # Los cuatro grupos de KPIs se envían en un único st.markdown con los valores ya formateados
+            kpis_html = "".join([
+                # Alcance Análisis
+                render_kpi_group("Alcance del Análisis (Excluyendo GR.ART.FICTICIO)", [
+                    ("Total Familias", f"{num_familias_reales}", "#111827"),
+                    ("Total Tiendas", f"{num_tiendas_reales}", "#111827"),
+                    ("Total Temporadas", f"{num_temporadas_reales}", "#111827"),
+                    ("Total Transacciones (Sin excluir GR.ART.FICTICIO)", f"{num_transacciones}", "#111827"),
+                ]),
+                # KPIs Generales (excluyendo GR.ART.FICTICIO)
+                render_kpi_group("KPIs Generales (Excluyendo GR.ART.FICTICIO)", [
+                    ("Total Ventas Brutas", f"{total_ventas_brutas_reales:,.0f}€", "#111827"),
+                    ("Devoluciones Reales", f"{devoluciones_reales:,.0f}€", "#dc2626"),
+                    ("Total Neto", f"{total_neto_reales:,.0f}€", "#059669"),
+                    ("Tasa Devolución", f"{tasa_devolucion_reales:.1f}%", "#dc2626"),
+                ]),
+                # KPIs GR.ART.FICTICIO
+                render_kpi_group("KPIs GR.ART.FICTICIO", [
+                    ("Total Ventas Brutas", f"{total_ventas_brutas_ficticio:,.0f}€", "#111827"),
+                    ("Devoluciones", f"{devoluciones_ficticio:,.0f}€", "#dc2626"),
+                    ("Total Neto", f"{total_neto_ficticio:,.0f}€", "#059669"),
+                    ("Tasa Devolución", f"{tasa_devolucion_ficticio:.1f}%", "#dc2626"),
+                ]),
+                # KPIs por Tipo de Tienda
+                render_kpi_group("KPIs por Tipo de Tienda (Excluyendo GR.ART.FICTICIO)", [
+                    ("Tiendas Físicas", f"{tiendas_fisicas_count}", "#111827"),
+                    ("Ventas Netas Físicas", f"{ventas_fisicas_dinero:,.0f}€", "#111827"),
+                    ("Tiendas Online", f"{tiendas_online_count}", "#111827"),
+                    ("Ventas Netas Online", f"{ventas_online_dinero:,.0f}€", "#111827"),
+                ]),
+            ])
+            st.markdown(kpis_html, unsafe_allow_html=True)
 
-            # KPIs Generales (excluyendo GR.ART.FICTICIO)
-            st.markdown("""
-                <div style="border: 1px solid #e5e7eb; border-radius: 8px; padding: 15px; margin-bottom: 15px; background-color: white;">
-                    <div style="color: #666666; font-size: 16px; font-weight: 600; margin-bottom: 10px; padding-bottom: 5px; border-bottom: 1px solid #e5e7eb;">
-                        KPIs Generales (Excluyendo GR.ART.FICTICIO)
-                    </div>
-                    <div style="display: flex; justify-content: space-between; gap: 15px;">
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Ventas Brutas</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Devoluciones Reales</p>
-                            <p style="color: #dc2626; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Neto</p>
-                            <p style="color: #059669; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Tasa Devolución</p>
-                            <p style="color: #dc2626; font-size: 24px; font-weight: bold; margin: 0;">{:.1f}%</p>
-                        </div>
-                    </div>
-                </div>
-            """.format(total_ventas_brutas_reales, devoluciones_reales, total_neto_reales, tasa_devolucion_reales), unsafe_allow_html=True)
-            
-            # KPIs GR.ART.FICTICIO
-            st.markdown("""
-                <div style="border: 1px solid #e5e7eb; border-radius: 8px; padding: 15px; margin-bottom: 15px; background-color: white;">
-                    <div style="color: #666666; font-size: 16px; font-weight: 600; margin-bottom: 10px; padding-bottom: 5px; border-bottom: 1px solid #e5e7eb;">
-                        KPIs GR.ART.FICTICIO
-                    </div>
-                    <div style="display: flex; justify-content: space-between; gap: 15px;">
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Ventas Brutas</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Devoluciones</p>
-                            <p style="color: #dc2626; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Total Neto</p>
-                            <p style="color: #059669; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Tasa Devolución</p>
-                            <p style="color: #dc2626; font-size: 24px; font-weight: bold; margin: 0;">{:.1f}%</p>
-                        </div>
-                    </div>
-                </div>
-            """.format(total_ventas_brutas_ficticio, devoluciones_ficticio, total_neto_ficticio,tasa_devolucion_ficticio), unsafe_allow_html=True)
-            
-            # KPIs por Tipo de Tienda
-            st.markdown("""
-                <div style="border: 1px solid #e5e7eb; border-radius: 8px; padding: 15px; margin-bottom: 15px; background-color: white;">
-                    <div style="color: #666666; font-size: 16px; font-weight: 600; margin-bottom: 10px; padding-bottom: 5px; border-bottom: 1px solid #e5e7eb;">
-                        KPIs por Tipo de Tienda (Excluyendo GR.ART.FICTICIO)
-                    </div>
-                    <div style="display: flex; justify-content: space-between; gap: 15px;">
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Tiendas Físicas</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{}</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Ventas Netas Físicas</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Tiendas Online</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{}</p>
-                        </div>
-                        <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white;">
-                            <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Ventas Netas Online</p>
-                            <p style="color: #111827; font-size: 24px; font-weight: bold; margin: 0;">{:,.0f}€</p>
-                        </div>
-                    </div>
-                </div>
-            """.format(tiendas_fisicas_count, ventas_fisicas_dinero, tiendas_online_count, ventas_online_dinero), unsafe_allow_html=True)
-            
-           
-            
             # --- Rotación de stock (OPTIMIZADA) ---
             (
                 tienda_mayor_rotacion, tienda_mayor_rotacion_dias, tienda_menor_rotacion, tienda_menor_rotacion_dias,
@@ -618,7 +925,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
 
             if tienda_mayor_rotacion is not None:
                 # Mostrar KPIs de rotación optimizados
-                st.markdown("""
+                st.markdown(f"""
                     <div style="border: 1px solid #e5e7eb; border-radius: 8px; padding: 15px; margin-bottom: 15px; background-color: white;">
                         <div style="color: #666666; font-size: 16px; font-weight: 600; margin-bottom: 10px; padding-bottom: 5px; border-bottom: 1px solid #e5e7eb;">
                             KPIs de Rotación de Stock
@@ -626,53 +933,47 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                         <div style="display: flex; justify-content: space-between; gap: 15px; flex-wrap: wrap;">
                             <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white; min-width: 200px;">
                                 <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Tienda Mayor Rotación</p>
-                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{}</p>
-                                <p style="color: #059669; font-size: 12px; margin: 0;">{:.1f} días mediana</p>
+                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{tienda_mayor_rotacion}</p>
+                                <p style="color: #059669; font-size: 12px; margin: 0;">{tienda_mayor_rotacion_dias:.1f} días mediana</p>
                             </div>
                             <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white; min-width: 200px;">
                                 <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Tienda Menor Rotación</p>
-                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{}</p>
-                                <p style="color: #dc2626; font-size: 12px; margin: 0;">{:.1f} días mediana</p>
+                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{tienda_menor_rotacion}</p>
+                                <p style="color: #dc2626; font-size: 12px; margin: 0;">{tienda_menor_rotacion_dias:.1f} días mediana</p>
                             </div>
                             <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white; min-width: 200px;">
                                 <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Producto Mayor Rotación</p>
-                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{}</p>
-                                <p style="color: #059669; font-size: 12px; margin: 0;">{:.1f} días mediana</p>
+                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{producto_mayor_rotacion}</p>
+                                <p style="color: #059669; font-size: 12px; margin: 0;">{producto_mayor_rotacion_dias:.1f} días mediana</p>
                             </div>
                             <div style="flex: 1; text-align: center; padding: 15px; border: 1px solid #e5e7eb; border-radius: 8px; background-color: white; min-width: 200px;">
                                 <p style="color: #666666; font-size: 14px; margin: 0 0 5px 0;">Producto Menor Rotación</p>
-                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{}</p>
-                                <p style="color: #dc2626; font-size: 12px; margin: 0;">{:.1f} días mediana</p>
+                                <p style="color: #111827; font-size: 18px; font-weight: bold; margin: 0;">{producto_menor_rotacion}</p>
+                                <p style="color: #dc2626; font-size: 12px; margin: 0;">{producto_menor_rotacion_dias:.1f} días mediana</p>
                             </div>
                         </div>
                         <div style="margin-top: 15px; padding-top: 15px; border-top: 1px solid #e5e7eb;">
                             <div style="display: flex; justify-content: space-between; gap: 15px; flex-wrap: wrap;">
                                 <div style="flex: 1; text-align: center; padding: 10px; border: 1px solid #e5e7eb; border-radius: 6px; background-color: #f9fafb; min-width: 150px;">
                                     <p style="color: #666666; font-size: 12px; margin: 0 0 3px 0;">Promedio Global</p>
-                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{:.1f} días</p>
+                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{promedio_global:.1f} días</p>
                                 </div>
                                 <div style="flex: 1; text-align: center; padding: 10px; border: 1px solid #e5e7eb; border-radius: 6px; background-color: #f9fafb; min-width: 150px;">
                                     <p style="color: #666666; font-size: 12px; margin: 0 0 3px 0;">Mediana Global</p>
-                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{:.1f} días</p>
+                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{mediana_global:.1f} días</p>
                                 </div>
                                 <div style="flex: 1; text-align: center; padding: 10px; border: 1px solid #e5e7eb; border-radius: 6px; background-color: #f9fafb; min-width: 150px;">
                                     <p style="color: #666666; font-size: 12px; margin: 0 0 3px 0;">Desv. Estándar</p>
-                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{:.1f} días</p>
+                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{std_global:.1f} días</p>
                                 </div>
                                 <div style="flex: 1; text-align: center; padding: 10px; border: 1px solid #e5e7eb; border-radius: 6px; background-color: #f9fafb; min-width: 150px;">
                                     <p style="color: #666666; font-size: 12px; margin: 0 0 3px 0;">Total Productos</p>
-                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{:,}</p>
+                                    <p style="color: #111827; font-size: 16px; font-weight: bold; margin: 0;">{total_productos_rotacion:,}</p>
                                 </div>
                             </div>
                         </div>
                     </div>
-                """.format(
-                    tienda_mayor_rotacion, tienda_mayor_rotacion_dias,
-                    tienda_menor_rotacion, tienda_menor_rotacion_dias,
-                    producto_mayor_rotacion, producto_mayor_rotacion_dias,
-                    producto_menor_rotacion, producto_menor_rotacion_dias,
-                    promedio_global, mediana_global, std_global, total_productos_rotacion
-                ), unsafe_allow_html=True)
+                """, unsafe_allow_html=True)
                 
                 # Mostrar estadísticas adicionales optimizadas
                 st.info(f"📊 Análisis basado en {total_productos_rotacion:,} productos con rotación calculada (filtrado de outliers: 0-365 días)")
@@ -684,12 +985,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             with col1b:
                 viz_title("Ventas Mensuales por Tipo de Tienda")
-                ventas_mes_tipo = df_ventas.groupby(['Mes', 'Es_Online']).agg({
-                    'Cantidad': 'sum',
-                    'Beneficio': 'sum'
-                }).reset_index()
-                
-                ventas_mes_tipo['Tipo'] = ventas_mes_tipo['Es_Online'].map({True: 'Online', False: 'Física'})
+                ventas_mes_tipo = calculate_monthly_sales_data(df_ventas)
                 
                 # Calculate dynamic width based on number of months
                 num_months = len(ventas_mes_tipo['Mes'].unique())
@@ -739,22 +1035,18 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 viz_title("Ranking de Tiendas Seleccionadas")
                 
                 # Filtrar solo las tiendas seleccionadas del ranking completo
-                tiendas_ranking = ventas_por_tienda_completo[ventas_por_tienda_completo['Tienda'].isin(tienda_seleccionada)].copy()
+                tiendas_ranking = ventas_por_tienda_completo[ventas_por_tienda_completo['Tienda'].isin(tienda_seleccionada)].sort_values('Ranking')
                 
                 # Calcular la familia más vendida para cada tienda (cached)
-                familias_por_tienda = calculate_family_rankings(df_ventas)
+                familias_por_tienda = calculate_family_rankings(df_ventas, dataframe_fingerprint(df_ventas))
                 
-                # Obtener la familia top para cada tienda seleccionada
-                familias_top = []
-                for tienda in tiendas_ranking['Tienda']:
-                    familias_tienda = familias_por_tienda[familias_por_tienda['Tienda'] == tienda]
-                    if not familias_tienda.empty:
-                        familia_top = familias_tienda.iloc[0]['Familia']
-                        familias_top.append(familia_top)
-                    else:
-                        familias_top.append('Sin datos')
-                
-                tiendas_ranking['Familia Top'] = familias_top
+                # Obtener la familia top para cada tienda seleccionada: primera fila por tienda
+                # (el ranking ya viene ordenado por cantidad) y un único map en lugar de un filtro por tienda
+                familia_top = (
+                    familias_por_tienda.drop_duplicates('Tienda', keep='first')
+                    .set_index('Tienda')['Familia'].astype(str)
+                )
+                tiendas_ranking['Familia Top'] = tiendas_ranking['Tienda'].map(familia_top).fillna('Sin datos')
                 
                 # Reordenar columnas
                 tiendas_ranking = tiendas_ranking[['Tienda', 'Ranking', 'Unidades Vendidas', 'Beneficio', 'Familia Top']]
@@ -772,32 +1064,11 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 with col2:
                     # Top 30 tiendas con más ventas
                     viz_title("Top 30 tiendas con más ventas")
-                    top_30_tiendas = ventas_por_tienda_completo.head(30)
+                    # Posiciones 1..30 del ranking (único, desempata igual que la tabla de tiendas seleccionadas)
+                    top_30_tiendas = ventas_por_tienda_completo.nsmallest(30, 'Ranking')
                     
-                    fig = px.bar(
-                        top_30_tiendas,
-                        x='Tienda',
-                        y='Beneficio',
-                        color='Beneficio',
-                        color_continuous_scale=COLOR_GRADIENT,
-                        height=400,
-                        labels={'Tienda': 'Tienda', 'Beneficio': 'Beneficio', 'Unidades Vendidas': 'Unidades'}
-                    )
-                    fig.update_layout(
-                        xaxis_tickangle=45,
-                        showlegend=False,
-                        margin=dict(t=0, b=0, l=0, r=0),
-                        paper_bgcolor="rgba(0,0,0,0)",
-                        plot_bgcolor="rgba(0,0,0,0)"
-                    )
-                    fig.update_traces(
-                        texttemplate='%{y:,.2f}€',
-                        textposition='outside',
-                        hovertemplate="Tienda: %{x}<br>Ventas: %{y:,.2f}€<br>Unidades: %{customdata:,}<extra></extra>",
-                        customdata=top_30_tiendas['Unidades Vendidas'],
-                        opacity=0.8
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
+                    # Figura cacheada: en reruns con el mismo ranking no se reconstruye con px
+                    st.plotly_chart(build_ranking_tiendas_figure(top_30_tiendas), use_container_width=True)
 
                 with col3:
                     total_tiendas = len(ventas_por_tienda_completo)
@@ -805,32 +1076,11 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     if total_tiendas > 30:
                         # Top 30 tiendas con menos ventas por Beneficio
                         viz_title("Top 30 tiendas con menos ventas")
-                        bottom_30_tiendas = ventas_por_tienda_completo.tail(30)
+                        # Últimas 30 posiciones del ranking, de mayor a menor Beneficio
+                        bottom_30_tiendas = ventas_por_tienda_completo.nlargest(30, 'Ranking').iloc[::-1]
                         
-                        fig = px.bar(
-                            bottom_30_tiendas,
-                            x='Tienda',
-                            y='Beneficio',
-                            color='Beneficio',
-                            color_continuous_scale=COLOR_GRADIENT,
-                            height=400,
-                            labels={'Tienda': 'Tienda', 'Beneficio': 'Beneficio', 'Unidades Vendidas': 'Unidades'}
-                        )
-                        fig.update_layout(
-                            xaxis_tickangle=45,
-                            showlegend=False,
-                            margin=dict(t=0, b=0, l=0, r=0),
-                            paper_bgcolor="rgba(0,0,0,0)",
-                            plot_bgcolor="rgba(0,0,0,0)"
-                        )
-                        fig.update_traces(
-                            texttemplate='%{y:,.2f}€',
-                            textposition='outside',
-                            hovertemplate="Tienda: %{x}<br>Ventas: %{y:,.2f}€<br>Unidades: %{customdata:,}<extra></extra>",
-                            customdata=bottom_30_tiendas['Unidades Vendidas'],
-                            opacity=0.8
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
+                        # Figura cacheada: en reruns con el mismo ranking no se reconstruye con px
+                        st.plotly_chart(build_ranking_tiendas_figure(bottom_30_tiendas), use_container_width=True)
                     else:
                         st.info(f"Solo hay {total_tiendas} tiendas donde se ha vendido este producto.")
 
@@ -845,24 +1095,15 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 if df_ventas.empty:
                     st.warning("No hay datos de ventas para la familia seleccionada.")
                 else:
-                    # Normalizar las tallas para asegurar consistencia
-                    df_ventas_temp = df_ventas.copy()
-                    df_ventas_temp['Talla'] = df_ventas_temp['Talla'].astype(str).str.upper().str.strip()
-                    
-                    #  Verificar tallas por familia
-                    if not df_ventas_temp.empty:
-                        familia_actual = df_ventas_temp['Familia'].iloc[0] if 'Familia' in df_ventas_temp.columns else 'Sin Familia'
-                        tallas_por_familia = df_ventas_temp[df_ventas_temp['Familia'] == familia_actual]['Talla'].unique()
-                        
+                    # Normalizar las tallas para asegurar consistencia (solo cambia la columna Talla)
+                    df_ventas_temp = df_ventas.assign(Talla=df_ventas['Talla'].astype(str).str.upper().str.strip())
                     
                     # Agrupamos por Talla y Temporada
                     tallas_sumadas = (
-                        df_ventas_temp.groupby(['Talla', 'Temporada'])['Cantidad']
+                        df_ventas_temp.groupby(['Talla', 'Temporada'], observed=True)['Cantidad']
                         .sum()
                         .reset_index()
                     )
-                    
-                    tallas_en_agrupado = tallas_sumadas['Talla'].unique()
                    
                     # Verificar si hay datos válidos para el gráfico
                     if not tallas_sumadas.empty and len(tallas_sumadas) > 0:
@@ -874,74 +1115,40 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                             tallas_sumadas_completo = None
                             
                             try:
-                                tallas_orden = sorted(tallas_presentes, key=custom_sort_key)
+                                tallas_orden = build_talla_order(tallas_presentes)
                                 
                                 # Asegurar que todas las tallas aparezcan en el gráfico
-                                # Crear un DataFrame completo con todas las combinaciones talla-temporada
+                                # DataFrame completo con todas las combinaciones talla-temporada (0 si no existe)
                                 temporadas_unicas = df_ventas_temp['Temporada'].unique()
-                                tallas_completas = []
-                                
-                                for talla in tallas_orden:
-                                    for temporada in temporadas_unicas:
-                                        # Buscar si existe esta combinación
-                                        existing_data = tallas_sumadas[
-                                            (tallas_sumadas['Talla'] == talla) & 
-                                            (tallas_sumadas['Temporada'] == temporada)
-                                        ]
-                                        
-                                        if not existing_data.empty:
-                                            tallas_completas.append({
-                                                'Talla': talla,
-                                                'Temporada': temporada,
-                                                'Cantidad': existing_data.iloc[0]['Cantidad']
-                                            })
-                                        else:
-                                            # Agregar con cantidad 0 si no existe
-                                            tallas_completas.append({
-                                                'Talla': talla,
-                                                'Temporada': temporada,
-                                                'Cantidad': 0
-                                            })
-                                
-                                # Crear DataFrame completo
-                                tallas_sumadas_completo = pd.DataFrame(tallas_completas)
+                                indice_completo = pd.MultiIndex.from_product(
+                                    [tallas_orden, list(temporadas_unicas)], names=['Talla', 'Temporada']
+                                )
+                                tallas_sumadas_completo = (
+                                    tallas_sumadas.astype({'Temporada': object})
+                                    .set_index(['Talla', 'Temporada'])['Cantidad']
+                                    .reindex(indice_completo, fill_value=0)
+                                    .reset_index()
+                                )
                                 
                                 # Verificar que el DataFrame se creó correctamente
                                 if tallas_sumadas_completo is not None and not tallas_sumadas_completo.empty:
-                                    # Verificar tallas en DataFrame completo
-                                    tallas_en_completo = tallas_sumadas_completo['Talla'].unique()
-                                    
-                                    # Verificar cantidades por talla
-                                    cantidades_por_talla = tallas_sumadas_completo.groupby('Talla')['Cantidad'].sum()
-                                    
                                     # Gráfico de barras apiladas por Temporada
                                     temporada_colors = get_temporada_colors(df_ventas_temp)
                                     
-                                    # Calcular altura dinámica basada en la cantidad de tallas
-                                    num_tallas = len(tallas_en_completo)  # Usar tallas del DataFrame completo
-                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                    
-                                    # Ordenar tallas del DataFrame completo usando custom_sort_key
-                                    tallas_orden_completo = sorted(tallas_en_completo, key=custom_sort_key)
-                                    
-                                    # Forzar todas las tallas a string para evitar problemas de categorías mixtas
-                                    tallas_sumadas_completo['Talla'] = tallas_sumadas_completo['Talla'].astype(str)
-                                    tallas_orden_completo = [str(t) for t in tallas_orden_completo]
-                                    
-                                    # Separar tallas numéricas y de letras
-                                    def es_numero(t):
-                                        try:
-                                            int(t)
-                                            return True
-                                        except:
-                                            return False
+                                    # Las tallas del DataFrame completo son exactamente tallas_orden (ya ordenadas
+                                    # y en texto, porque Talla se normalizó con astype(str) arriba)
+                                    tallas_orden_completo = tallas_orden
                                     
-                                    tallas_numericas = [t for t in tallas_orden_completo if es_numero(t)]
-                                    tallas_letras = [t for t in tallas_orden_completo if not es_numero(t)]
+                                    # Separar tallas numéricas y de letras (misma regla que int(t), sin excepciones)
+                                    tallas_array = np.array(tallas_orden_completo, dtype=object)
+                                    es_numero = pd.Series(tallas_array, dtype=object).str.fullmatch(r'\s*[+-]?\d+\s*').to_numpy(dtype=bool)
+                                    tallas_numericas = tallas_array[es_numero].tolist()
+                                    tallas_letras = tallas_array[~es_numero].tolist()
                                     
-                                    # Filtrar DataFrame para cada tipo
-                                    df_num = tallas_sumadas_completo[tallas_sumadas_completo['Talla'].isin(tallas_numericas)]
-                                    df_let = tallas_sumadas_completo[tallas_sumadas_completo['Talla'].isin(tallas_letras)]
+                                    # Filtrar DataFrame para cada tipo: una sola máscara (toda talla es de uno u otro tipo)
+                                    es_talla_numerica = tallas_sumadas_completo['Talla'].isin(tallas_numericas).to_numpy()
+                                    df_num = tallas_sumadas_completo[es_talla_numerica]
+                                    df_let = tallas_sumadas_completo[~es_talla_numerica]
                                     
                                     # Mostrar gráfico de tallas numéricas si existen
                                 else:
@@ -949,80 +1156,26 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                                     df_num = pd.DataFrame()
                                     df_let = pd.DataFrame()
                                 
-                                # Mostrar gráfico de tallas numéricas si existen
-                                if len(tallas_numericas) > 0 and not df_num.empty:
-                                    altura_num = max(400, min(800, len(tallas_numericas) * 50))
-                                    fig_num = px.bar(
-                                        df_num,
-                                        x='Talla',
-                                        y='Cantidad',
-                                        color='Temporada',
-                                        text='Cantidad',
-                                        category_orders={'Talla': tallas_numericas},
-                                        color_discrete_map=temporada_colors,
-                                        height=altura_num
-                                    )
-                                    max_cantidad = df_num['Cantidad'].max()
-                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                    fig_num.update_layout(
-                                        xaxis_title="Talla",
-                                        yaxis_title="Unidades Vendidas",
-                                        barmode="stack",
-                                        margin=dict(t=30, b=0, l=0, r=0),
-                                        paper_bgcolor="rgba(0,0,0,0)",
-                                        plot_bgcolor="rgba(0,0,0,0)",
-                                        yaxis=dict(
-                                            range=[0, y_max],
-                                            showgrid=True,
-                                            gridcolor='rgba(0,0,0,0.1)'
-                                        ),
-                                        xaxis=dict(
-                                            categoryorder='array',
-                                            categoryarray=tallas_numericas,
-                                            showticklabels=True
-                                        )
-                                    )
-                                    fig_num.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                    st.plotly_chart(fig_num, use_container_width=True)
-                                
-                                # Mostrar gráfico de tallas de letras si existen
-                                if len(tallas_letras) > 0 and not df_let.empty:
-                                    altura_let = max(400, min(800, len(tallas_letras) * 50))
-                                    fig_let = px.bar(
-                                        df_let,
-                                        x='Talla',
-                                        y='Cantidad',
-                                        color='Temporada',
-                                        text='Cantidad',
-                                        category_orders={'Talla': tallas_letras},
-                                        color_discrete_map=temporada_colors,
-                                        height=altura_let
+                                # Un único gráfico con una faceta por tipo de talla (numéricas / letras)
+                                grupos_tallas = [
+                                    (tipo, df_tipo, orden)
+                                    for tipo, df_tipo, orden in [('Numéricas', df_num, tallas_numericas), ('Letras', df_let, tallas_letras)]
+                                    if len(orden) > 0 and not df_tipo.empty
+                                ]
+                                if grupos_tallas:
+                                    df_tallas_grafico = pd.concat(
+                                        [df_tipo.assign(Tipo_Talla=tipo) for tipo, df_tipo, _ in grupos_tallas],
+                                        ignore_index=True
                                     )
-                                    max_cantidad_let = df_let['Cantidad'].max()
-                                    y_max_let = max_cantidad_let * 1.1 if max_cantidad_let > 0 else 100
-                                    fig_let.update_layout(
-                                        xaxis_title="Talla",
-                                        yaxis_title="Unidades Vendidas",
-                                        barmode="stack",
-                                        margin=dict(t=30, b=0, l=0, r=0),
-                                        paper_bgcolor="rgba(0,0,0,0)",
-                                        plot_bgcolor="rgba(0,0,0,0)",
-                                        yaxis=dict(
-                                            range=[0, y_max_let],
-                                            showgrid=True,
-                                            gridcolor='rgba(0,0,0,0.1)'
-                                        ),
-                                        xaxis=dict(
-                                            categoryorder='array',
-                                            categoryarray=tallas_letras,
-                                            showticklabels=True
-                                        )
+                                    # Figura cacheada por datos: en reruns sin cambios no se reconstruye con px
+                                    fig_tallas = build_tallas_figure(
+                                        df_tallas_grafico,
+                                        {tipo: orden for tipo, _, orden in grupos_tallas},
+                                        temporada_colors
                                     )
-                                    fig_let.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                    st.plotly_chart(fig_let, use_container_width=True)
-                                
-                                # Si no hay tallas válidas, mostrar advertencia
-                                if (len(tallas_numericas) == 0 or df_num.empty) and (len(tallas_letras) == 0 or df_let.empty):
+                                    st.plotly_chart(fig_tallas, use_container_width=True)
+                                else:
+                                    # Si no hay tallas válidas, mostrar advertencia
                                     st.warning("⚠️ No hay tallas válidas en los datos de ventas.")
                             except Exception as e:
                                 st.warning(f"⚠️ Error al crear el gráfico de tallas: {str(e)}")
@@ -1040,34 +1193,33 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             # Col 5,6: Tablas por Temporada con layout dinámico
             # Preparar datos de entrada en almacén para las tablas por temporada
             # Agregar Familia a df_productos usando Código único codes de df_ventas
-            df_productos_temp = df_productos.copy()
-            df_productos_temp['Fecha almacén'] = pd.to_datetime(df_productos_temp['Fecha almacén'], format='%d/%m/%Y', errors='coerce')
+            # Fecha almacén ya llega convertida desde preprocess_productos_data (cacheado);
+            # assign crea el nuevo DataFrame sin copiar explícitamente todas las columnas
+            df_productos_temp = df_productos.assign(**{'Fecha almacén': parse_fechas(df_productos['Fecha almacén'])})
 
             # OPTIMIZACIÓN: Merge más eficiente con validación previa
             if 'Código único' in df_ventas.columns and 'Familia' in df_ventas.columns:
                 
                 
-                # OPTIMIZACIÓN: Usar merge directo sin debug excesivo
-                df_productos_temp = df_productos_temp.merge(
-                    df_ventas[['Código único', 'Familia']].drop_duplicates(),
-                    on='Código único',
-                    how='left'
-                )
-                
-                # Fill missing Familia values
-                df_productos_temp['Familia'] = df_productos_temp['Familia'].fillna('Sin Familia')
+                # OPTIMIZACIÓN: Lookup Código único -> Familia (cacheado) en lugar de merge
+                familia_map = build_familia_map(df_ventas)
+                df_productos_temp['Familia'] = df_productos_temp['Código único'].map(familia_map).fillna('Sin Familia')
             else:
                 st.warning("⚠️ No se encontraron columnas 'Código único' o 'Familia' en df_ventas")
                 df_productos_temp['Familia'] = 'Sin Familia'
             
             # OPTIMIZACIÓN: Filtrar por familia una sola vez
-            # Obtener la familia más común en los datos filtrados
-            familia_actual = df_ventas['Familia'].mode().iloc[0] if not df_ventas.empty else 'Sin Familia'
-            df_almacen_fam = df_productos_temp[df_productos_temp['Familia'] == familia_actual].copy()
+            # Obtener la familia más común en los datos filtrados; en caso de empate, la menor (como mode())
+            if not df_ventas.empty:
+                conteo_familias = df_ventas['Familia'].value_counts()
+                familia_actual = min(conteo_familias.index[conteo_familias == conteo_familias.max()].astype(str))
+            else:
+                familia_actual = 'Sin Familia'
+            df_almacen_fam = df_productos_temp[df_productos_temp['Familia'] == familia_actual]
             
             # Si no hay datos para la familia actual, usar todos los datos de productos
             if df_almacen_fam.empty:
-                df_almacen_fam = df_productos_temp.copy()
+                df_almacen_fam = df_productos_temp
             
             # Filtrar productos sin tema definido
             df_almacen_fam = df_almacen_fam[df_almacen_fam['Tema_temporada'] != 'Sin Tema']
@@ -1091,16 +1243,14 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
  
                 # Separar filas con fecha válida y sin fecha
                 df_almacen_fam_con_fecha = df_almacen_fam.dropna(subset=['Fecha almacén'])
-                df_almacen_fam_sin_fecha = df_almacen_fam[df_almacen_fam['Fecha almacén'].isna()].copy()
+                sin_fecha = df_almacen_fam['Fecha almacén'].isna()
                 
                 # Agregar mes de entrada para filas con fecha válida
-                df_almacen_fam_con_fecha['Mes Entrada'] = df_almacen_fam_con_fecha['Fecha almacén'].dt.to_period('M').astype(str)
+                df_almacen_fam_con_fecha['Mes Entrada'] = formatear_mes(df_almacen_fam_con_fecha['Fecha almacén'])
                 
-                # Separar filas pendientes de entrega (sin fecha válida)
-                if not df_almacen_fam_sin_fecha.empty:
-                    # Crear DataFrame separado para pendientes de entrega
-                    df_pendientes = df_almacen_fam_sin_fecha.copy()
-                    df_pendientes['Estado'] = 'Pendiente de entrega'
+                # Separar filas pendientes de entrega (sin fecha válida): un único DataFrame nuevo vía assign
+                if sin_fecha.any():
+                    df_pendientes = df_almacen_fam[sin_fecha].assign(Estado='Pendiente de entrega')
                 else:
                     df_pendientes = pd.DataFrame()
                 
@@ -1114,28 +1264,23 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 # Buscar la columna correcta para cantidad de entrada en almacén
             
                 
+                # Filtrar hasta el último mes de ventas antes de agrupar (menos filas que agregar)
                 datos_tabla = (
-                    df_almacen_fam.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
+                    df_almacen_fam.loc[df_almacen_fam['Mes Entrada'] <= ultimo_mes_ventas]
+                    .groupby(['Mes Entrada', 'Talla'], observed=True)['Cantidad pedida']
                     .sum()
                     .reset_index()
                     .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
                     .sort_values(['Mes Entrada', 'Talla'])
                 )
                 
-                # Filtrar datos hasta el último mes de ventas
-                datos_tabla = datos_tabla[datos_tabla['Mes Entrada'] <= ultimo_mes_ventas]
-                
                 if not datos_tabla.empty:
                 
-                    # Obtener todos los temas únicos de df_productos (excluyendo "Sin Tema")
-                    temas_productos = sorted(df_almacen_fam[df_almacen_fam['Tema_temporada'] != 'Sin Tema']['Tema_temporada'].unique())
-                    
-                    # Calcular temas y num_temas (excluyendo "Sin Tema")
-                    temas = temas_productos
+                    # Temas válidos de df_productos: solo se crean paneles para temas reales
+                    temas = sorted(set(valores_presentes(df_almacen_fam['Tema_temporada'])) - TEMAS_INVALIDOS)
                     num_temas = len(temas)
-                    
 
-                    if num_temas > 0 and any(tema not in ['Sin Tema', 'nan', 'None'] for tema in temas):
+                    if num_temas > 0:
                         # --- Sección: Entradas almacén y traspasos ---
                         st.markdown('<hr style="margin: 1em 0; border-top: 2px solid #bbb;">', unsafe_allow_html=True)
                         st.markdown('<h4 style="color:#333;font-weight:bold;text-align:center;">Entradas almacén y traspasos</h4>', unsafe_allow_html=True)
@@ -1153,30 +1298,19 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                         
                         if tiendas_especificas:
                             st.subheader("Análisis Temporal: Entrada Almacén → Envío → Primera Venta")
-                            # Preparar datos para el análisis temporal
-                            df_almacen_fam_timeline = df_almacen_fam.copy()
-                            df_traspasos_timeline = df_traspasos_filtrado.copy()
-                            # Usar procesamiento flexible de fechas
-                            try:
-                                df_traspasos_timeline['Fecha enviado'] = pd.to_datetime(df_traspasos_timeline['Fecha enviado'], format='%d/%m/%Y', errors='coerce')
-                            except:
-                                try:
-                                    df_traspasos_timeline['Fecha enviado'] = pd.to_datetime(df_traspasos_timeline['Fecha enviado'], dayfirst=True, errors='coerce')
-                                except:
-                                    df_traspasos_timeline['Fecha enviado'] = pd.to_datetime(df_traspasos_timeline['Fecha enviado'], errors='coerce')
-                            df_ventas_timeline = df_ventas.copy()
-                            df_ventas_timeline['Fecha venta'] = pd.to_datetime(df_ventas_timeline['Fecha venta'], errors='coerce')
-
-                            # 1. Solo el primer envío por tienda
-                            df_traspasos_timeline = (
-                                df_traspasos_timeline
-                                .sort_values('Fecha enviado')
-                                .drop_duplicates(subset=['Código único', 'Talla', 'Tienda'], keep='first')
-                            )
+                            # Las fechas ya vienen convertidas de preprocess_*_data (cacheado): se trabaja sobre los
+                            # DataFrames originales, sin copias ni re-parseo por rerun
+
+                            # 1. Solo el primer envío por tienda (min por grupo, sin ordenar todo el DataFrame)
+                            df_traspasos_timeline = df_traspasos_filtrado.loc[
+                                df_traspasos_filtrado
+                                .groupby(['Código único', 'Talla', 'Tienda'], observed=True, sort=False)['Fecha enviado']
+                                .idxmin()
+                            ]
 
                             # 2. Merge con almacén
                             merged = pd.merge(
-                                df_almacen_fam_timeline,
+                                df_almacen_fam,
                                 df_traspasos_timeline,
                                 left_on=['Código único', 'Talla'],
                                 right_on=['Código único', 'Talla'],
@@ -1184,52 +1318,52 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                             )
                             merged = merged[merged['Fecha enviado'] >= merged['Fecha almacén']]
 
-                            timeline_data = []
-                            for _, row in merged.iterrows():
-                                fecha_entrada = row['Fecha almacén']
-                                fecha_envio = row['Fecha enviado']
-                                codigo_unico = row['Código único'].strip()
-                                talla = row['Talla'].strip()
-                                tienda_envio = row['Tienda']
-                                tema = row['Tema']
-
-                                # 3. Solo la primera venta en esa tienda para ese producto/talla
-                                ventas_producto = df_ventas_timeline[
-                                    (df_ventas_timeline['Código único'].str.strip() == codigo_unico) &
-                                    (df_ventas_timeline['Talla'].str.strip() == talla) &
-                                    (df_ventas_timeline['Tienda'].str.strip() == tienda_envio.strip()) &
-                                    (df_ventas_timeline['Fecha venta'] >= fecha_entrada) &
-                                    (df_ventas_timeline['Cantidad'] > 0)
-                                ]
-                                if not ventas_producto.empty:
-                                    primera_venta = ventas_producto.sort_values('Fecha venta').iloc[0]
-                                    fecha_primera_venta = primera_venta['Fecha venta']
-                                    dias_entrada_venta = (fecha_primera_venta - fecha_envio).days
-                                else:
-                                    fecha_primera_venta = None
-                                    dias_entrada_venta = -1
-                                dias_entrada_envio = (fecha_envio - fecha_entrada).days
-                                timeline_data.append({
-                                    'Código único': codigo_unico,
-                                    'Tema': tema,
-                                    'Talla': talla,
-                                    'Tienda Envío': tienda_envio,
-                                    'Fecha Entrada Almacén': fecha_entrada.strftime('%d/%m/%Y'),
-                                    'Fecha enviado a tienda': fecha_envio.strftime('%d/%m/%Y'),
-                                    'Fecha Primera Venta': fecha_primera_venta.strftime('%d/%m/%Y') if fecha_primera_venta else "Sin ventas",
-                                    'Días Entrada-Envío': dias_entrada_envio,
-                                    'Días Envío-Primera Venta': dias_entrada_venta if dias_entrada_venta != -1 else -1
-                                })
-
-                            if timeline_data:
-                                df_timeline = pd.DataFrame(timeline_data)
-                                df_timeline['Fecha Entrada Almacén'] = pd.to_datetime(df_timeline['Fecha Entrada Almacén'], format='%d/%m/%Y')
+                            # 3. Primera venta posterior a la entrada en almacén (las claves llegan sin espacios desde
+                            #    preprocess_*_data). merge_asof hace una búsqueda ordenada por clave en lugar de cruzar
+                            #    todas las ventas de cada clave; 'by' exige el mismo dtype, así que las claves van como object,
+                            #    y las fechas deben tener la misma resolución, así que ambas van como datetime64[ns]
+                            claves = ['Código único', 'Talla', 'Tienda']
+                            tipos_claves = dict.fromkeys(claves, object)
+                            ventas_timeline = (
+                                df_ventas.loc[df_ventas['Cantidad'] > 0, claves + ['Fecha venta']]
+                                .astype({**tipos_claves, 'Fecha venta': 'datetime64[ns]'})
+                                .rename(columns={'Fecha venta': 'Fecha Primera Venta'})
+                                .sort_values('Fecha Primera Venta')
+                            )
+                            merged = merged.astype({**tipos_claves, 'Fecha almacén': 'datetime64[ns]'})
+                            primeras_ventas = pd.merge_asof(
+                                merged[claves + ['Fecha almacén']].drop_duplicates().sort_values('Fecha almacén'),
+                                ventas_timeline,
+                                left_on='Fecha almacén',
+                                right_on='Fecha Primera Venta',
+                                by=claves,
+                                direction='forward'
+                            )
+                            merged = merged.merge(primeras_ventas, on=claves + ['Fecha almacén'], how='left')
+
+                            df_timeline = pd.DataFrame({
+                                'Código único': merged['Código único'],
+                                'Tema': merged['Tema'],
+                                'Talla': merged['Talla'],
+                                'Tienda Envío': merged['Tienda'],
+                                'Fecha Entrada Almacén': merged['Fecha almacén'],
+                                'Fecha enviado a tienda': merged['Fecha enviado'],
+                                'Fecha Primera Venta': merged['Fecha Primera Venta'].dt.strftime('%d/%m/%Y').fillna('Sin ventas'),
+                                'Días Entrada-Envío': (merged['Fecha enviado'] - merged['Fecha almacén']).dt.days,
+                                'Días Envío-Primera Venta': (merged['Fecha Primera Venta'] - merged['Fecha enviado']).dt.days.fillna(-1).astype('int32')
+                            })
+
+                            if not df_timeline.empty:
+                                # Fechas como datetime: orden nativo y formato dd/mm/yyyy lo aplica Streamlit al mostrar
                                 df_timeline = df_timeline.sort_values('Fecha Entrada Almacén', ascending=False)
-                                df_timeline['Fecha Entrada Almacén'] = df_timeline['Fecha Entrada Almacén'].dt.strftime('%d/%m/%Y')
                                 st.dataframe(
                                     df_timeline,
                                     use_container_width=True,
-                                    hide_index=True
+                                    hide_index=True,
+                                    column_config={
+                                        'Fecha Entrada Almacén': st.column_config.DateColumn(format='DD/MM/YYYY'),
+                                        'Fecha enviado a tienda': st.column_config.DateColumn(format='DD/MM/YYYY')
+                                    }
                                 )
                                 col1, col2, col3 = st.columns(3)
                                 with col1:
@@ -1245,254 +1379,39 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                                 st.info("No se encontraron datos de envíos para los productos de entrada en almacén de la familia seleccionada.")
                         
                         else:
+                            # Temporada de ventas equivalente a cada tema: "T_OI25" -> "O2025", "T_PV24" -> "P2024"
+                            tema_a_temporada = {
+                                tema: f"{tema[2]}20{tema[4:]}" if tema.startswith("T_") and len(tema) == 6 else None
+                                for tema in temas
+                            }
+                            temporadas_con_ventas = set(valores_presentes(df_ventas['Temporada']))
+
+                            # Agregados por tema y posiciones por temporada, cacheados entre reruns y compartidos por todos los paneles.
+                            # A la caché solo llegan las columnas que usa (hash barato)
+                            agregados_temas = {
+                                **calculate_tema_aggregates(
+                                    df_almacen_fam[['Tema_temporada', 'Código único', 'Mes Entrada', 'Talla', 'Cantidad pedida']]
+                                ),
+                                'ventas': df_ventas,
+                                'huella_ventas': dataframe_fingerprint(df_ventas),
+                                'tema_a_temporada': tema_a_temporada,
+                                # Temas cuya temporada tiene ventas en la selección: el resto no consulta ventas
+                                'temas_con_ventas': {
+                                    tema for tema, temporada in tema_a_temporada.items() if temporada in temporadas_con_ventas
+                                }
+                            }
+
                             if num_temas == 1:
                                 # Un tema: centrado
                                 col5a, col5b, col5c = st.columns([1, 3, 1])
                                 with col5b:
-                                    tema = temas[0]
-                                    st.subheader(f"Entrada Almacén - {tema}")
-                                    
-                                   # tema looks like "T_OI25" or "T_PV24"
-                                    if tema.startswith("T_") and len(tema) == 6:
-                                        # Extract the season part (OI / PV) and year part (23,24,25)
-                                        season_code = tema[2:4]   # 'OI' or 'PV'
-                                        year_code = tema[4:]      # '23', '24', '25'
-                                        temporada_comparacion = f"{season_code[0]}20{year_code}"
-                                    else:
-                                        temporada_comparacion = None
-
-                                    
-                                    if temporada_comparacion:
-                                        ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                        if not ventas_temporada.empty:
-                                            Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                            ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                            if not ventas_tema.empty:
-                                                ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                datos_comparacion = pd.merge(
-                                                    enviado_por_talla, 
-                                                    ventas_por_talla, 
-                                                    on='Talla', 
-                                                    how='outer'
-                                                ).fillna(0)
-                                                # Ordenar tallas
-                                                datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                
-                                                # Crear gráfico con plotly usando el mismo layout que "Unidades Vendidas por Talla"
-                                                # Calcular altura dinámica basada en la cantidad de tallas
-                                                num_tallas = len(datos_comparacion)
-                                                altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                
-                                                # Preparar datos para plotly
-                                                datos_plotly = []
-                                                for _, row in datos_comparacion.iterrows():
-                                                    datos_plotly.append({
-                                                        'Talla': row['Talla'],
-                                                        'Tipo': 'Enviado Almacén',
-                                                        'Cantidad': row['Cantidad pedida']
-                                                    })
-                                                    datos_plotly.append({
-                                                        'Talla': row['Talla'],
-                                                        'Tipo': 'Ventas',
-                                                        'Cantidad': row['Cantidad']
-                                                    })
-                                                
-                                                df_plotly = pd.DataFrame(datos_plotly)
-                                                
-                                                fig = px.bar(
-                                                    df_plotly,
-                                                    x='Talla',
-                                                    y='Cantidad',
-                                                    color='Tipo',
-                                                    text='Cantidad',
-                                                    category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                    color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                    height=altura_dinamica
-                                                )
-                                                
-                                                # Calcular rango dinámico para el eje Y
-                                                max_cantidad = df_plotly['Cantidad'].max()
-                                                min_cantidad = df_plotly['Cantidad'].min()
-                                                
-                                                # Ajustar el rango del eje Y para que se vea bien
-                                                if max_cantidad > 0:
-                                                    # Agregar un 10% de margen arriba
-                                                    y_max = max_cantidad * 1.1
-                                                    # Para el mínimo, usar 0 o un valor pequeño
-                                                    y_min = 0
-                                                else:
-                                                    y_max = 100
-                                                    y_min = 0
-                                                
-                                                fig.update_layout(
-                                                    title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                    xaxis_title="Talla",
-                                                    yaxis_title="Cantidad",
-                                                    barmode="group",
-                                                    margin=dict(t=30, b=0, l=0, r=0),
-                                                    paper_bgcolor="rgba(0,0,0,0)",
-                                                    plot_bgcolor="rgba(0,0,0,0)",
-                                                    yaxis=dict(
-                                                        range=[y_min, y_max],
-                                                        showgrid=True,
-                                                        gridcolor='rgba(0,0,0,0.1)'
-                                                    )
-                                                )
-                                                
-                                                fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                st.plotly_chart(fig, use_container_width=True)
-                                    
-                                    # Filtrar datos para este tema específico
-                                    datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                    datos_tabla_tema = (
-                                        datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                        .sum()
-                                        .reset_index()
-                                        .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                        .sort_values(['Mes Entrada', 'Talla'])
-                                    )
-                                    
-                                    if not datos_tabla_tema.empty:
-                                        # Crear tabla pivot para mejor visualización
-                                        tabla_pivot = datos_tabla_tema.pivot_table(
-                                            index='Mes Entrada',
-                                            columns='Talla',
-                                            values='Cantidad Entrada Almacén',
-                                            fill_value=0
-                                        ).round(0)
-                                        tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                        tabla_pivot = tabla_pivot[tallas_orden]
-                                        # Contenedor centrado para la tabla
-                                        with st.container():
-                                            st.markdown('<div style="text-align:center;">', unsafe_allow_html=True)
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            st.markdown('</div>', unsafe_allow_html=True)
-                                        total_temp = tabla_pivot.sum().sum()
-                                        st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                    else:
-                                        st.info(f"No hay datos para el tema {tema}")
+                                    render_entrada_almacen_tema(temas[0], agregados_temas)
                             elif num_temas == 2:
                                 # Dos temas: centrados con espaciado
                                 col5a, col5, col6, col6a = st.columns([1, 2, 2, 1])
-                                for i, tema in enumerate(temas):
-                                    with locals()[f'col{5+i}']:
-                                        st.subheader(f"Entrada Almacén - {tema}")
-                                        
-                                        # tema looks like "T_OI25" or "T_PV24"
-                                        if tema.startswith("T_") and len(tema) == 6:
-                                            # Extract the season part (OI / PV) and year part (23,24,25)
-                                            season_code = tema[2:4]   # 'OI' or 'PV'
-                                            year_code = tema[4:]      # '23', '24', '25'
-                                            temporada_comparacion = f"{season_code[0]}20{year_code}"
-                                        else:
-                                            temporada_comparacion = None
-
-                                        
-                                        if temporada_comparacion:
-                                            ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                            if not ventas_temporada.empty:
-                                                Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                                ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                                if not ventas_tema.empty:
-                                                    ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                    enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                    enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                    datos_comparacion = pd.merge(
-                                                        enviado_por_talla, 
-                                                        ventas_por_talla, 
-                                                        on='Talla', 
-                                                        how='outer'
-                                                    ).fillna(0)
-                                                    # Ordenar tallas
-                                                    datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                    
-                                                    # Layout dinámico
-                                                    num_tallas = len(datos_comparacion)
-                                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                    
-                                                    # Preparar datos para plotly
-                                                    datos_plotly = []
-                                                    for _, row in datos_comparacion.iterrows():
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Enviado Almacén',
-                                                            'Cantidad': row['Cantidad pedida']
-                                                        })
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Ventas',
-                                                            'Cantidad': row['Cantidad']
-                                                        })
-                                                    
-                                                    df_plotly = pd.DataFrame(datos_plotly)
-                                                    
-                                                    fig = px.bar(
-                                                        df_plotly,
-                                                        x='Talla',
-                                                        y='Cantidad',
-                                                        color='Tipo',
-                                                        text='Cantidad',
-                                                        category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                        color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                        height=altura_dinamica
-                                                    )
-                                                    
-                                                    # Rango dinámico eje Y
-                                                    max_cantidad = df_plotly['Cantidad'].max()
-                                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                                    
-                                                    fig.update_layout(
-                                                        title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                        xaxis_title="Talla",
-                                                        yaxis_title="Cantidad",
-                                                        barmode="group",
-                                                        margin=dict(t=30, b=0, l=0, r=0),
-                                                        paper_bgcolor="rgba(0,0,0,0)",
-                                                        plot_bgcolor="rgba(0,0,0,0)",
-                                                        yaxis=dict(
-                                                            range=[0, y_max],
-                                                            showgrid=True,
-                                                            gridcolor='rgba(0,0,0,0.1)'
-                                                        )
-                                                    )
-                                                    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                    st.plotly_chart(fig, use_container_width=True)
-                                        
-                                        # Filtrar datos para este tema específico
-                                        datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                        datos_tabla_tema = (
-                                            datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                            .sum()
-                                            .reset_index()
-                                            .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                            .sort_values(['Mes Entrada', 'Talla'])
-                                        )
-                                        
-                                        if not datos_tabla_tema.empty:
-                                            # Crear tabla pivot para mejor visualización
-                                            tabla_pivot = datos_tabla_tema.pivot_table(
-                                                index='Mes Entrada',
-                                                columns='Talla',
-                                                values='Cantidad Entrada Almacén',
-                                                fill_value=0
-                                            ).round(0)
-                                            tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                            tabla_pivot = tabla_pivot[tallas_orden]
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            total_temp = tabla_pivot.sum().sum()
-                                            st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                        else:
-                                            st.info(f"No hay datos para el tema {tema}")
+                                for col, tema in zip((col5, col6), temas):
+                                    with col:
+                                        render_entrada_almacen_tema(tema, agregados_temas)
                             else:
                                 # Múltiples temas: centrados con espaciado
                                 col5a, col5, col6, col6a = st.columns([1, 2, 2, 1])
@@ -1501,254 +1420,10 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                                 temas_col6 = temas[mitad:]
                                 with col5:
                                     for tema in temas_col5:
-                                        st.subheader(f"Entrada Almacén - {tema}")
-                                        
-                                        
-                                        # tema looks like "T_OI25" or "T_PV24"
-                                        if tema.startswith("T_") and len(tema) == 6:
-                                            # Extract the season part (OI / PV) and year part (23,24,25)
-                                            season_code = tema[2:4]   # 'OI' or 'PV'
-                                            year_code = tema[4:]      # '23', '24', '25'
-                                            temporada_comparacion = f"{season_code[0]}20{year_code}"
-                                        else:
-                                            temporada_comparacion = None
-
-                                        
-                                        if temporada_comparacion:
-                                            # Obtener datos de ventas para la temporada
-                                            ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                            if not ventas_temporada.empty:
-                                                # Obtener Código únicos del tema Código únicoual
-                                                Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                                
-                                                # Filtrar ventas por Código únicos del tema
-                                                ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                                
-                                                if not ventas_tema.empty:
-                                                    # Agrupar ventas por talla
-                                                    ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                    
-                                                    # Obtener datos de enviado del tema
-                                                    enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                    enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                    
-                                                    # Combinar datos
-                                                    datos_comparacion = pd.merge(
-                                                        enviado_por_talla, 
-                                                        ventas_por_talla, 
-                                                        on='Talla', 
-                                                        how='outer'
-                                                    ).fillna(0)
-                                                    
-                                                    # Ordenar tallas
-                                                    datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                    
-                                                    # Layout dinámico
-                                                    num_tallas = len(datos_comparacion)
-                                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                    
-                                                    # Preparar datos para plotly
-                                                    datos_plotly = []
-                                                    for _, row in datos_comparacion.iterrows():
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Enviado Almacén',
-                                                            'Cantidad': row['Cantidad pedida']
-                                                        })
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Ventas',
-                                                            'Cantidad': row['Cantidad']
-                                                        })
-                                                    
-                                                    df_plotly = pd.DataFrame(datos_plotly)
-                                                    
-                                                    fig = px.bar(
-                                                        df_plotly,
-                                                        x='Talla',
-                                                        y='Cantidad',
-                                                        color='Tipo',
-                                                        text='Cantidad',
-                                                        category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                        color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                        height=altura_dinamica
-                                                    )
-                                                    
-                                                    # Rango dinámico eje Y
-                                                    max_cantidad = df_plotly['Cantidad'].max()
-                                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                                    
-                                                    fig.update_layout(
-                                                        title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                        xaxis_title="Talla",
-                                                        yaxis_title="Cantidad",
-                                                        barmode="group",
-                                                        margin=dict(t=30, b=0, l=0, r=0),
-                                                        paper_bgcolor="rgba(0,0,0,0)",
-                                                        plot_bgcolor="rgba(0,0,0,0)",
-                                                        yaxis=dict(
-                                                            range=[0, y_max],
-                                                            showgrid=True,
-                                                            gridcolor='rgba(0,0,0,0.1)'
-                                                        )
-                                                    )
-                                                    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                    st.plotly_chart(fig, use_container_width=True)
-                                        
-                                        # Filtrar datos para este tema específico
-                                        datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                        datos_tabla_tema = (
-                                            datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                            .sum()
-                                            .reset_index()
-                                            .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                            .sort_values(['Mes Entrada', 'Talla'])
-                                        )
-                                        
-                                        if not datos_tabla_tema.empty:
-                                            # Crear tabla pivot para mejor visualización
-                                            tabla_pivot = datos_tabla_tema.pivot_table(
-                                                index='Mes Entrada',
-                                                columns='Talla',
-                                                values='Cantidad Entrada Almacén',
-                                                fill_value=0
-                                            ).round(0)
-                                            tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                            tabla_pivot = tabla_pivot[tallas_orden]
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            total_temp = tabla_pivot.sum().sum()
-                                            st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                        else:
-                                            st.info(f"No hay datos para el tema {tema}")
+                                        render_entrada_almacen_tema(tema, agregados_temas)
                                 with col6:
                                     for tema in temas_col6:
-                                        st.subheader(f"Entrada Almacén - {tema}")
-                                        
-                                        # Crear gráfico de comparación enviado vs ventas
-                                        # tema looks like "T_OI25" or "T_PV24"
-                                        if tema.startswith("T_") and len(tema) == 6:
-                                            # Extract the season part (OI / PV) and year part (23,24,25)
-                                            season_code = tema[2:4]   # 'OI' or 'PV'
-                                            year_code = tema[4:]      # '23', '24', '25'
-                                            temporada_comparacion = f"{season_code[0]}20{year_code}"
-                                        else:
-                                            temporada_comparacion = None
-
-                                        
-                                        if temporada_comparacion:
-                                            # Obtener datos de ventas para la temporada
-                                            ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                            if not ventas_temporada.empty:
-                                                # Obtener Código únicos del tema Código únicoual
-                                                Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                                
-                                                # Filtrar ventas por Código únicos del tema
-                                                ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                                
-                                                if not ventas_tema.empty:
-                                                    # Agrupar ventas por talla
-                                                    ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                    
-                                                    # Obtener datos de enviado del tema
-                                                    enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                    enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                    
-                                                    # Combinar datos
-                                                    datos_comparacion = pd.merge(
-                                                        enviado_por_talla, 
-                                                        ventas_por_talla, 
-                                                        on='Talla', 
-                                                        how='outer'
-                                                    ).fillna(0)
-                                                    
-                                                    # Ordenar tallas
-                                                    datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                    
-                                                    # Layout dinámico
-                                                    num_tallas = len(datos_comparacion)
-                                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                    
-                                                    # Preparar datos para plotly
-                                                    datos_plotly = []
-                                                    for _, row in datos_comparacion.iterrows():
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Enviado Almacén',
-                                                            'Cantidad': row['Cantidad pedida']
-                                                        })
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Ventas',
-                                                            'Cantidad': row['Cantidad']
-                                                        })
-                                                    
-                                                    df_plotly = pd.DataFrame(datos_plotly)
-                                                    
-                                                    fig = px.bar(
-                                                        df_plotly,
-                                                        x='Talla',
-                                                        y='Cantidad',
-                                                        color='Tipo',
-                                                        text='Cantidad',
-                                                        category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                        color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                        height=altura_dinamica
-                                                    )
-                                                    
-                                                    # Rango dinámico eje Y
-                                                    max_cantidad = df_plotly['Cantidad'].max()
-                                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                                    
-                                                    fig.update_layout(
-                                                        title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                        xaxis_title="Talla",
-                                                        yaxis_title="Cantidad",
-                                                        barmode="group",
-                                                        margin=dict(t=30, b=0, l=0, r=0),
-                                                        paper_bgcolor="rgba(0,0,0,0)",
-                                                        plot_bgcolor="rgba(0,0,0,0)",
-                                                        yaxis=dict(
-                                                            range=[0, y_max],
-                                                            showgrid=True,
-                                                            gridcolor='rgba(0,0,0,0.1)'
-                                                        )
-                                                    )
-                                                    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                    st.plotly_chart(fig, use_container_width=True)
-                                        
-                                        # Filtrar datos para este tema específico
-                                        datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                        datos_tabla_tema = (
-                                            datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                            .sum()
-                                            .reset_index()
-                                            .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                            .sort_values(['Mes Entrada', 'Talla'])
-                                        )
-                                        
-                                        if not datos_tabla_tema.empty:
-                                            # Crear tabla pivot para mejor visualización
-                                            tabla_pivot = datos_tabla_tema.pivot_table(
-                                                index='Mes Entrada',
-                                                columns='Talla',
-                                                values='Cantidad Entrada Almacén',
-                                                fill_value=0
-                                            ).round(0)
-                                            tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                            tabla_pivot = tabla_pivot[tallas_orden]
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            total_temp = tabla_pivot.sum().sum()
-                                            st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                        else:
-                                            st.info(f"No hay datos para el tema {tema}")
+                                        render_entrada_almacen_tema(tema, agregados_temas)
                 else:
                     st.info("No hay datos de entrada en almacén disponibles para la familia seleccionada.")
 
@@ -1757,23 +1432,16 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 st.markdown("---")
                 viz_title("Pendientes de Entrega")
                 
-                # Preparar datos de pendientes por talla
-                datos_pendientes = (
-                    df_pendientes.groupby(['Talla'])['Cantidad pedida']
-                    .sum()
-                    .reset_index()
-                    .rename(columns={'Cantidad pedida': 'Cantidad Pendiente'})
-                    .sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                )
+                # Preparar datos de pendientes por talla (cacheado)
+                datos_pendientes = calculate_pendientes_por_talla(df_pendientes[['Talla', 'Cantidad pedida']])
                 
                 if not datos_pendientes.empty:
                     # Mostrar tabla de pendientes
                     st.dataframe(
-                        datos_pendientes.style.format({
-                            'Cantidad Pendiente': '{:,.0f}'
-                        }),
+                        datos_pendientes,
                         use_container_width=True,
-                        hide_index=True
+                        hide_index=True,
+                        column_config=columnas_enteras(['Cantidad Pendiente'])
                     )
                     
                     # Mostrar total
@@ -1806,68 +1474,31 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     with col1:
                         mostrar_todos_meses = st.checkbox("Mostrar todos los meses", value=False, help="Si está marcado, se mostrarán todos los meses disponibles. Si no, solo hasta el último mes de ventas.")
                     
-                    # Preparar datos de cantidad pedida
-                    datos_pedida = (
-                        df_almacen_fam.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                        .sum()
-                        .reset_index()
-                        .rename(columns={'Mes Entrada': 'Mes', 'Cantidad pedida': 'Cantidad pedida'})
-                        .sort_values(['Mes', 'Talla'])
-                    )
-                    
-                    # Crear un DataFrame completo con todos los meses y tallas disponibles
-                    # para asegurar que aparezcan todos los meses, incluso con 0
+                    # Tabla mes x talla en una sola pasada: todos los meses y tallas disponibles,
+                    # con 0 donde no hubo entradas (reindex en lugar de producto cartesiano + merge)
                     todos_meses = sorted(df_almacen_fam['Mes Entrada'].unique())
-                    todas_tallas = sorted(df_almacen_fam['Talla'].unique(), key=custom_sort_key)
-                    
-                    # Crear un DataFrame completo con todas las combinaciones
-                    from itertools import product
-                    combinaciones_completas = pd.DataFrame(
-                        list(product(todos_meses, todas_tallas)),
-                        columns=['Mes', 'Talla']
+                    todas_tallas = build_talla_order(df_almacen_fam['Talla'].unique())
+                    tabla_pedida_pivot = (
+                        df_almacen_fam.groupby(['Mes Entrada', 'Talla'], observed=True)['Cantidad pedida']
+                        .sum()
+                        .unstack('Talla', fill_value=0)
+                        .reindex(index=todos_meses, columns=todas_tallas, fill_value=0)
+                        .rename_axis(index='Mes')
                     )
                     
-                    # Unir con los datos reales, manteniendo todas las combinaciones
-                    datos_pedida = combinaciones_completas.merge(
-                        datos_pedida, 
-                        on=['Mes', 'Talla'], 
-                        how='left'
-                    ).fillna(0)
-                    
-                    # Ordenar por mes y talla
-                    datos_pedida = datos_pedida.sort_values(['Mes', 'Talla'])
-                    
                     # Aplicar filtro según la opción del usuario
                     if not mostrar_todos_meses:
-                        # Filtrar datos hasta el último mes de ventas
-                        # Convertir los meses a fechas reales para comparación correcta
-                        datos_pedida['Mes_Date'] = pd.to_datetime(datos_pedida['Mes'] + '-01')
-                        ultimo_mes_ventas_date = pd.to_datetime(ultimo_mes_ventas + '-01')
-                        
-                        # Aplicar filtro usando fechas reales
-                        datos_pedida = datos_pedida[datos_pedida['Mes_Date'] <= ultimo_mes_ventas_date]
-                        
-                        # Eliminar la columna temporal
-                        datos_pedida = datos_pedida.drop('Mes_Date', axis=1)
+                        # Filtrar meses hasta el último mes de ventas. Los meses son texto 'YYYY-MM'
+                        # (formatear_mes): el orden lexicográfico coincide con el cronológico
+                        tabla_pedida_pivot = tabla_pedida_pivot[tabla_pedida_pivot.index <= ultimo_mes_ventas]
                     
-                    if not datos_pedida.empty:
-                        # Crear tabla pivot para mejor visualización
-                        tabla_pedida_pivot = datos_pedida.pivot_table(
-                            index='Mes',
-                            columns='Talla',
-                            values='Cantidad pedida',
-                            fill_value=0
-                        ).round(0)
-                        
-                        # Ordenar tallas usando la función custom_sort_key
-                        tallas_orden = sorted(tabla_pedida_pivot.columns, key=custom_sort_key)
-                        tabla_pedida_pivot = tabla_pedida_pivot[tallas_orden]
-                        
+                    if not tabla_pedida_pivot.empty:
                         # Mostrar la tabla
                         st.dataframe(
-                            tabla_pedida_pivot.style.format("{:,.0f}"),
+                            tabla_pedida_pivot,
                             use_container_width=True,
-                            hide_index=False
+                            hide_index=False,
+                            column_config=columnas_enteras(tabla_pedida_pivot.columns)
                         )
                         
                         # Mostrar total
@@ -1893,61 +1524,52 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             # Preparar datos de traspasos hasta la fecha máxima de ventas
             ultimo_mes_ventas = df_ventas['Mes'].max()
-            df_traspasos_filtrado = df_traspasos_filtrado.copy()
-            
-            # Convertir fecha de traspasos y filtrar hasta el último mes de ventas
-            df_traspasos_filtrado['Mes Enviado'] = pd.to_datetime(df_traspasos_filtrado['Fecha enviado']).dt.to_period('M').astype(str)
-            df_traspasos_filtrado = df_traspasos_filtrado[df_traspasos_filtrado['Mes Enviado'] <= ultimo_mes_ventas]
-            
-            # Agrupar ventas por tienda y temporada
-            ventas_por_tienda_temp = df_ventas.groupby(['Tienda', 'Temporada'])['Cantidad'].sum().reset_index()
-            ventas_por_tienda_temp['Tipo'] = 'Ventas'
-            ventas_por_tienda_temp = ventas_por_tienda_temp.rename(columns={'Cantidad': 'Cantidad Total'})
             
-            # Obtener Código únicos que existen en ventas (limpiar espacios)
-            Código_único_en_ventas = df_ventas['Código único'].str.strip().unique()
+            # Filtrar traspasos hasta el último mes de ventas: 'Mes' es el mes de 'Fecha enviado' ('YYYY-MM'),
+            # calculado una vez en el preprocesado, así que basta con una máscara (sin copia ni columna temporal)
+            df_traspasos_filtrado = df_traspasos_filtrado[df_traspasos_filtrado['Mes'] <= ultimo_mes_ventas]
             
+            # Agrupar ventas por tienda y temporada; en la misma pasada, las devoluciones (unidades negativas)
+            cantidad = df_ventas['Cantidad']
+            ventas_devoluciones = (
+                pd.DataFrame({'Cantidad': cantidad, 'Devoluciones': (-cantidad).clip(lower=0)})
+                .groupby([df_ventas['Tienda'], df_ventas['Temporada']], observed=True)
+                .sum()
+            )
+            ventas_por_tienda_temp = ventas_devoluciones['Cantidad']
+            devoluciones_por_tienda = ventas_devoluciones['Devoluciones'].groupby(level='Tienda', observed=True).sum()
             
-            # Filtrar traspasos para solo incluir Código únicos que están en ventas
-            df_traspasos_filtrado_código_único = df_traspasos_filtrado[df_traspasos_filtrado['Código único'].isin(Código_único_en_ventas)]
+            # Filtrar traspasos para solo incluir Código únicos que están en ventas (ya sin espacios desde el preprocesado)
+            df_traspasos_filtrado_código_único = df_traspasos_filtrado[
+                df_traspasos_filtrado['Código único'].isin(df_ventas['Código único'].unique())
+            ]
             
-            # Agrupar traspasos por tienda y temporada
-            if not df_traspasos_filtrado_código_único.empty:
-                # Asegurar que la columna Temporada existe en traspasos
-                if 'Temporada' not in df_traspasos_filtrado_código_único.columns:
-                    temporada_columns = [col for col in df_traspasos_filtrado_código_único.columns if 'temporada' in col.lower() or 'season' in col.lower()]
-                    if temporada_columns:
-                        df_traspasos_filtrado_código_único['Temporada'] = df_traspasos_filtrado_código_único[temporada_columns[0]]
-                    else:
-                        df_traspasos_filtrado_código_único['Temporada'] = 'Sin Temporada'
-                else:
-                    df_traspasos_filtrado_código_único['Temporada'] = df_traspasos_filtrado_código_único['Temporada'].fillna('Sin Temporada')
-                
-                # Limpiar temporada en traspasos para que coincida con ventas
-                df_traspasos_filtrado_código_único['Temporada'] = df_traspasos_filtrado_código_único['Temporada'].str.strip().str[:5]
-                
-                traspasos_por_tienda_temp = df_traspasos_filtrado_código_único.groupby(['Tienda', 'Temporada'])['Cantidad enviada'].sum().reset_index()
-                traspasos_por_tienda_temp['Tipo'] = 'Traspasos'
-                traspasos_por_tienda_temp = traspasos_por_tienda_temp.rename(columns={'Cantidad enviada': 'Cantidad Total'})
-            else:
-                # Si no hay traspasos filtrados, crear un DataFrame vacío con la estructura correcta
-                traspasos_por_tienda_temp = pd.DataFrame(columns=['Tienda', 'Temporada', 'Cantidad Total', 'Tipo'])
+            # Agrupar traspasos por tienda y temporada (Temporada ya normalizada como en ventas desde el preprocesado)
+            traspasos_por_tienda_temp = df_traspasos_filtrado_código_único.groupby(['Tienda', 'Temporada'], observed=True)['Cantidad enviada'].sum()
             
-            # Combinar datos
-            datos_comparacion = pd.concat([ventas_por_tienda_temp, traspasos_por_tienda_temp], ignore_index=True)
+            # Combinar los dos agregados en una sola concatenación etiquetada por Tipo
+            # (sin traspasos, el agregado vacío conserva la estructura)
+            datos_comparacion = (
+                pd.concat({'Ventas': ventas_por_tienda_temp, 'Traspasos': traspasos_por_tienda_temp}, names=['Tipo'])
+                .rename('Cantidad Total')
+                .reset_index()
+            )
+            # Unidades como int32: las trazas reciben arrays NumPy enteros, más compactos de serializar
+            datos_comparacion['Cantidad Total'] = reducir_a_int32(datos_comparacion['Cantidad Total'])
             
             if not datos_comparacion.empty:
-                # Obtener top 30 tiendas por ventas totales
-                top_tiendas_ventas = df_ventas.groupby('Tienda')['Cantidad'].sum().nlargest(50).index.tolist()
+                # Obtener top 50 tiendas por ventas totales (a partir del agregado por tienda y temporada, sin volver a recorrer ventas)
+                top_tiendas_ventas = (
+                    ventas_por_tienda_temp.groupby(level='Tienda', observed=True).sum().nlargest(50).index.tolist()
+                )
                 
                 # Filtrar datos para top 30 tiendas
                 datos_top_tiendas = datos_comparacion[datos_comparacion['Tienda'].isin(top_tiendas_ventas)]
                 
                 if not datos_top_tiendas.empty:
-                    # Crear gráfico con exCódigo únicoamente 2 barras por tienda (Ventas y Traspasos)
-                    # Preparar datos para el nuevo formato
-                    ventas_data = datos_top_tiendas[datos_top_tiendas['Tipo'] == 'Ventas'].copy()
-                    traspasos_data = datos_top_tiendas[datos_top_tiendas['Tipo'] == 'Traspasos'].copy()
+                    # Crear gráfico con exactamente 2 barras por tienda (Ventas y Traspasos)
+                    # Un solo groupby reparte las filas por (tipo, temporada), sin máscaras por traza
+                    grupos_tipo_temporada = dict(iter(datos_top_tiendas.groupby(['Tipo', 'Temporada'], sort=False)))
                     
                     # Obtener colores de temporada
                     temporada_colors = get_temporada_colors(df_ventas)
@@ -1962,51 +1584,42 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     # Definir diferentes tonos de amarillo para traspasos por temporada
                     yellow_colors = ['#ffff00', '#ffeb3b', '#ffc107', '#ff9800', '#ff5722', '#f57c00', '#ef6c00', '#e65100']
                     
-                    # Crear datos para cada tienda con dos barras (Ventas y Traspasos)
-                    for tienda in tiendas_unicas:
-                        # Datos de ventas para esta tienda
-                        ventas_tienda = ventas_data[ventas_data['Tienda'] == tienda]
-                        traspasos_tienda = traspasos_data[traspasos_data['Tienda'] == tienda]
-                        
-                        # Agregar barra de VENTAS (dividida por temporada)
-                        if not ventas_tienda.empty:
-                            for i, temporada in enumerate(temporadas):
-                                ventas_temp = ventas_tienda[ventas_tienda['Temporada'] == temporada]
-                                if not ventas_temp.empty:
-                                    fig.add_trace(go.Bar(
-                                        name=f'Ventas - {temporada}',
-                                        x=[f'{tienda} - Ventas'],
-                                        y=ventas_temp['Cantidad Total'],
-                                        marker_color=temporada_colors.get(temporada, '#1f77b4'),
-                                        text=ventas_temp['Cantidad Total'],
-                                        texttemplate='%{text:,.0f}',
-                                        textposition='inside',
-                                        hovertemplate=f"Tienda: {tienda}<br>Tipo: Ventas<br>Temporada: {temporada}<br>Cantidad: %{{y:,.0f}}<extra></extra>",
-                                        opacity=0.8,
-                                        showlegend=True if tienda == tiendas_unicas[0] else False,  # Solo mostrar legend para la primera tienda
-                                        legendgroup=f'Ventas - {temporada}'
-                                    ))
-                        
-                        # Agregar barra de TRASPASOS (dividida por temporada)
-                        if not traspasos_tienda.empty:
-                            for i, temporada in enumerate(temporadas):
-                                traspasos_temp = traspasos_tienda[traspasos_tienda['Temporada'] == temporada]
-                                if not traspasos_temp.empty:
-                                    # Usar diferentes tonos de amarillo para cada temporada
-                                    yellow_color = yellow_colors[i % len(yellow_colors)]
-                                    fig.add_trace(go.Bar(
-                                        name=f'Traspasos - {temporada}',
-                                        x=[f'{tienda} - Traspasos'],
-                                        y=traspasos_temp['Cantidad Total'],
-                                        marker_color=yellow_color,  # Diferentes tonos de amarillo por temporada
-                                        text=traspasos_temp['Cantidad Total'],
-                                        texttemplate='%{text:,.0f}',
-                                        textposition='inside',
-                                        hovertemplate=f"Tienda: {tienda}<br>Tipo: Traspasos<br>Temporada: {temporada}<br>Cantidad: %{{y:,.0f}}<extra></extra>",
-                                        opacity=0.8,
-                                        showlegend=True if tienda == tiendas_unicas[0] else False,  # Solo mostrar legend para la primera tienda
-                                        legendgroup=f'Traspasos - {temporada}'
-                                    ))
+                    # Una traza por tipo y temporada con todas sus tiendas en x (apiladas por temporada),
+                    # en lugar de una traza por tienda y temporada
+                    tiendas_por_tipo = {'Ventas': set(), 'Traspasos': set()}
+                    for tipo, tiendas_tipo in tiendas_por_tipo.items():
+                        for i, temporada in enumerate(temporadas):
+                            datos_temp = grupos_tipo_temporada.get((tipo, temporada))
+                            if datos_temp is None:
+                                continue
+                            # Ventas con el color de su temporada; traspasos con diferentes tonos de amarillo
+                            if tipo == 'Ventas':
+                                color = temporada_colors.get(temporada, '#1f77b4')
+                            else:
+                                color = yellow_colors[i % len(yellow_colors)]
+                            tiendas_temp = datos_temp['Tienda'].astype(str)
+                            tiendas_tipo.update(datos_temp['Tienda'])
+                            fig.add_trace(go.Bar(
+                                name=f'{tipo} - {temporada}',
+                                x=(tiendas_temp + f' - {tipo}').to_numpy(),
+                                y=datos_temp['Cantidad Total'].to_numpy(),
+                                customdata=tiendas_temp.to_numpy(),
+                                marker_color=color,
+                                text=datos_temp['Cantidad Total'].to_numpy(),
+                                texttemplate='%{text:,.0f}',
+                                textposition='inside',
+                                hovertemplate=f"Tienda: %{{customdata}}<br>Tipo: {tipo}<br>Temporada: {temporada}<br>Cantidad: %{{y:,.0f}}<extra></extra>",
+                                opacity=0.8,
+                                legendgroup=f'{tipo} - {temporada}'
+                            ))
+                    
+                    # Orden del eje x: por tienda, su barra de ventas y después la de traspasos
+                    orden_barras = [
+                        f'{tienda} - {tipo}'
+                        for tienda in tiendas_unicas
+                        for tipo, tiendas_tipo in tiendas_por_tipo.items()
+                        if tienda in tiendas_tipo
+                    ]
                     
                     # Configurar layout
                     fig.update_layout(
@@ -2014,8 +1627,9 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                         xaxis_title="Tienda",
                         yaxis_title="Cantidad Total",
                         barmode='stack',  # Barras apiladas por temporada
-                        xaxis_tickangle=45,
+                        xaxis=dict(tickangle=45, categoryorder='array', categoryarray=orden_barras),
                         showlegend=True,
+                        uirevision='ventas_traspasos_tienda',  # Conserva zoom y leyenda entre reruns
                         margin=dict(t=30, b=0, l=0, r=0),
                         paper_bgcolor="rgba(0,0,0,0)",
                         plot_bgcolor="rgba(0,0,0,0)",
@@ -2028,73 +1642,62 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     st.subheader("Resumen de Ventas vs Traspasos por Temporada")
                     
                     # Tabla con breakdown por temporada
-                    resumen_temporada = datos_top_tiendas.groupby(['Tienda', 'Tipo', 'Temporada'])['Cantidad Total'].sum().reset_index()
-                    resumen_pivot_temp = resumen_temporada.pivot_table(
+                    # datos_top_tiendas ya tiene una fila por (Tipo, Tienda, Temporada): basta con un pivot, sin reagregar
+                    resumen_pivot_temp = datos_top_tiendas.pivot(
                         index=['Tienda', 'Temporada'], 
                         columns='Tipo', 
-                        values='Cantidad Total', 
-                        fill_value=0
-                    ).reset_index()
+                        values='Cantidad Total'
+                    ).fillna(0).reset_index()
                     
                     # Calcular totales por tienda
-                    resumen_totales = datos_top_tiendas.groupby(['Tienda', 'Tipo'])['Cantidad Total'].sum().reset_index()
+                    resumen_totales = datos_top_tiendas.groupby(['Tienda', 'Tipo'], observed=True, sort=False)['Cantidad Total'].sum().reset_index()
                     resumen_pivot_totales = resumen_totales.pivot(index='Tienda', columns='Tipo', values='Cantidad Total').fillna(0)
                     
-                    # Verificar si existe la columna 'Traspasos' en el pivot table
-                    if 'Traspasos' in resumen_pivot_totales.columns:
-                        resumen_pivot_totales['Diferencia'] = resumen_pivot_totales['Ventas'] - resumen_pivot_totales['Traspasos']
-                        resumen_pivot_totales['Eficiencia %'] = (resumen_pivot_totales['Ventas'] / resumen_pivot_totales['Traspasos'] * 100).fillna(0)
-                    else:
-                        # Si no hay columna 'Traspasos', usar valores por defecto
+                    # Si no hay columna 'Traspasos' en el pivot table, usar 0 (Diferencia = Ventas, Eficiencia 0)
+                    if 'Traspasos' not in resumen_pivot_totales.columns:
                         resumen_pivot_totales['Traspasos'] = 0
-                        resumen_pivot_totales['Diferencia'] = resumen_pivot_totales['Ventas']
-                        resumen_pivot_totales['Eficiencia %'] = 0
+                    resumen_pivot_totales['Diferencia'] = resumen_pivot_totales['Ventas'] - resumen_pivot_totales['Traspasos']
 
-                    # Calcular Devoluciones (cantidad negativa) por tienda
-                    devoluciones_por_tienda = df_ventas[df_ventas['Cantidad'] < 0].groupby('Tienda')['Cantidad'].sum().abs()
+                    # Devoluciones (cantidad negativa) por tienda, ya calculadas junto a las ventas
                     resumen_pivot_totales['Devoluciones'] = devoluciones_por_tienda.reindex(resumen_pivot_totales.index).fillna(0)
                     
-                    # Calcular Ratio de devolución (Devoluciones / Ventas * 100)
-                    resumen_pivot_totales['Ratio de devolución %'] = (resumen_pivot_totales['Devoluciones'] / resumen_pivot_totales['Ventas'] * 100).fillna(0)
+                    # Eficiencia (Ventas / Traspasos * 100) y Ratio de devolución (Devoluciones / Ventas * 100)
+                    # en una sola división NumPy sobre las columnas apiladas; divisor 0 -> 0%
+                    numeradores = resumen_pivot_totales[['Ventas', 'Devoluciones']].to_numpy(dtype='float64')
+                    divisores = resumen_pivot_totales[['Traspasos', 'Ventas']].to_numpy(dtype='float64')
+                    porcentajes = np.divide(numeradores, divisores, out=np.zeros_like(numeradores), where=divisores != 0) * 100.0
+                    resumen_pivot_totales['Eficiencia %'] = porcentajes[:, 0]
+                    resumen_pivot_totales['Ratio de devolución %'] = porcentajes[:, 1]
                     
-                    resumen_pivot_totales = resumen_pivot_totales.round(2)
+                    # Unidades como enteros y porcentajes redondeados: formato en el navegador, sin Styler
+                    columnas_unidades = ['Ventas', 'Traspasos', 'Diferencia', 'Devoluciones']
+                    columnas_porcentaje = ['Eficiencia %', 'Ratio de devolución %']
+                    resumen_pivot_totales[columnas_unidades] = resumen_pivot_totales[columnas_unidades].round(0).astype('int64')
+                    resumen_pivot_totales[columnas_porcentaje] = resumen_pivot_totales[columnas_porcentaje].round(2)
                     
                     # Mostrar tabla de totales
                     st.write("**Totales por Tienda:**")
                     st.dataframe(
-                        resumen_pivot_totales.style.format({
-                            'Ventas': '{:,.0f}',
-                            'Traspasos': '{:,.0f}',
-                            'Diferencia': '{:,.0f}',
-                            'Devoluciones': '{:,.0f}',
-                            'Eficiencia %': '{:.1f}%',
-                            'Ratio de devolución %': '{:.1f}%'
-                        }),
-                        use_container_width=True
+                        resumen_pivot_totales,
+                        use_container_width=True,
+                        column_config={
+                            **columnas_enteras(columnas_unidades),
+                            **{col: st.column_config.NumberColumn(format='%.1f%%') for col in columnas_porcentaje}
+                        }
                     )
                     
                     # Mostrar tabla detallada por temporada
                     st.write("**Detalle por Temporada:**")
                     
-                    # Verificar si existe la columna 'Traspasos' en la tabla de temporadas
-                    if 'Traspasos' in resumen_pivot_temp.columns:
-                        st.dataframe(
-                            resumen_pivot_temp.style.format({
-                                'Ventas': '{:,.0f}',
-                                'Traspasos': '{:,.0f}'
-                            }),
-                            use_container_width=True
-                        )
-                    else:
-                        # Si no hay columna 'Traspasos', añadirla con valores 0
+                    # Si no hay columna 'Traspasos', añadirla con valores 0
+                    if 'Traspasos' not in resumen_pivot_temp.columns:
                         resumen_pivot_temp['Traspasos'] = 0
-                        st.dataframe(
-                            resumen_pivot_temp.style.format({
-                                'Ventas': '{:,.0f}',
-                                'Traspasos': '{:,.0f}'
-                            }),
-                            use_container_width=True
-                        )
+                    resumen_pivot_temp[['Ventas', 'Traspasos']] = resumen_pivot_temp[['Ventas', 'Traspasos']].round(0).astype('int64')
+                    st.dataframe(
+                        resumen_pivot_temp,
+                        use_container_width=True,
+                        column_config=columnas_enteras(['Ventas', 'Traspasos'])
+                    )
                 else:
                     st.info("No hay datos suficientes para mostrar la comparación.")
             else:
@@ -2107,177 +1710,77 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             st.error(f"Error al calcular KPIs: {e}")
 
     elif seccion == "Geográfico y Tiendas":
-        # Preparar datos
-        ventas_por_zona = df_ventas.groupby('Zona Geográfica')['Cantidad'].sum().reset_index()
-        ventas_por_tienda = df_ventas.groupby('Tienda')['Cantidad'].sum().reset_index()
-        tiendas_por_zona = df_ventas[['Tienda', 'Zona Geográfica']].drop_duplicates().groupby('Zona Geográfica').count().reset_index()
+        # Preparar datos (agregados por zona cacheados por huella de ventas: los reruns sin cambios no recalculan)
+        huella_ventas = dataframe_fingerprint(df_ventas)
+        ventas_por_zona, tiendas_por_zona, zona_mes_evol = calculate_zona_aggregates(df_ventas, huella_ventas)
 
         # 1. KPIs: Mejor y peor tienda por zona
         viz_title("KPIs por Zona - Mejor y Peor Tienda")
         
         try:
-            # Calcular ventas por tienda y zona
-            ventas_tienda_zona = df_ventas.groupby(['Zona Geográfica', 'Tienda']).agg({
-                'Cantidad': 'sum',
-                'Beneficio': 'sum'
-            }).reset_index()
-            
-            # Limpiar nombres de tiendas problemáticos
-            ventas_tienda_zona['Tienda'] = ventas_tienda_zona['Tienda'].astype(str)
-            ventas_tienda_zona['Tienda'] = ventas_tienda_zona['Tienda'].replace({
-                'COMODIN': 'Sin Asignar',
-                'nan': 'Sin Asignar',
-                'None': 'Sin Asignar',
-                '': 'Sin Asignar'
-            })
+            # Ventas por tienda y zona con su media de zona y % vs media (cacheado)
+            ventas_tienda_zona = calculate_ventas_tienda_zona(df_ventas, huella_ventas)
             
-            # Asegurar que las columnas numéricas son del tipo correcto
-            ventas_tienda_zona['Cantidad'] = pd.to_numeric(ventas_tienda_zona['Cantidad'], errors='coerce').fillna(0)
-            ventas_tienda_zona['Beneficio'] = pd.to_numeric(ventas_tienda_zona['Beneficio'], errors='coerce').fillna(0)
-            
-            # Asegurar que Zona Geográfica es string
-            ventas_tienda_zona['Zona Geográfica'] = ventas_tienda_zona['Zona Geográfica'].astype(str)
-            
-            # Calcular media de ventas por zona
-            media_por_zona = ventas_tienda_zona.groupby('Zona Geográfica')['Cantidad'].mean().reset_index()
-            media_por_zona = media_por_zona.rename(columns={'Cantidad': 'Media_Zona'})
-            
-            # Unir con ventas por tienda
-            ventas_tienda_zona = ventas_tienda_zona.merge(media_por_zona, on='Zona Geográfica')
-            
-            # Calcular porcentaje vs media con manejo de división por cero
-            ventas_tienda_zona['%_vs_Media'] = 0.0  # Default value
-            mask = ventas_tienda_zona['Media_Zona'] > 0
-            ventas_tienda_zona.loc[mask, '%_vs_Media'] = (
-                (ventas_tienda_zona.loc[mask, 'Cantidad'] - ventas_tienda_zona.loc[mask, 'Media_Zona']) / 
-                ventas_tienda_zona.loc[mask, 'Media_Zona'] * 100
-            ).round(1)
-            
-            # Encontrar mejor y peor tienda por zona con manejo de errores
-            mejores_tiendas = []
-            peores_tiendas = []
-            
-            for zona in ventas_tienda_zona['Zona Geográfica'].unique():
-                zona_data = ventas_tienda_zona[ventas_tienda_zona['Zona Geográfica'] == zona].copy()
-                if not zona_data.empty and len(zona_data) > 0:
-                    # Encontrar mejor tienda (máxima cantidad)
-                    try:
-                        mejor_idx = zona_data['Cantidad'].idxmax()
-                        if pd.notna(mejor_idx) and mejor_idx in zona_data.index:
-                            mejores_tiendas.append(zona_data.loc[mejor_idx].to_dict())
-                    except:
-                        pass
-                    
-                    # Encontrar peor tienda (mínima cantidad)
-                    try:
-                        peor_idx = zona_data['Cantidad'].idxmin()
-                        if pd.notna(peor_idx) and peor_idx in zona_data.index:
-                            peores_tiendas.append(zona_data.loc[peor_idx].to_dict())
-                    except:
-                        pass
-            
-            mejores_tiendas = pd.DataFrame(mejores_tiendas) if mejores_tiendas else pd.DataFrame()
-            peores_tiendas = pd.DataFrame(peores_tiendas) if peores_tiendas else pd.DataFrame()
+            # Mejor y peor tienda por zona (máxima y mínima cantidad) en una sola reducción agrupada
+            extremos_zona = ventas_tienda_zona.groupby('Zona Geográfica', observed=True, sort=False)['Cantidad'].agg(['idxmax', 'idxmin'])
+            mejores_tiendas = ventas_tienda_zona.loc[extremos_zona['idxmax']].reset_index(drop=True)
+            peores_tiendas = ventas_tienda_zona.loc[extremos_zona['idxmin']].reset_index(drop=True)
             
             # Mostrar KPIs en formato de tarjetas
-            zonas = sorted([str(z) for z in df_ventas['Zona Geográfica'].unique() if pd.notna(z)])
+            # Zonas presentes, tomadas del agregado por zona ya cacheado (sin recorrer ventas)
+            zonas = sorted(ventas_por_zona['Zona Geográfica'].astype(str))
+            
+            # Filas de mejor/peor tienda indexadas por zona: búsqueda directa en vez de filtrar por cada zona
+            mejor_por_zona = mejores_tiendas.set_index('Zona Geográfica').to_dict('index')
+            peor_por_zona = peores_tiendas.set_index('Zona Geográfica').to_dict('index')
             
+            # Todas las tarjetas en un único bloque HTML (un solo st.markdown, no uno por zona)
+            tarjetas_zona = []
+            zonas_sin_datos = []
             for zona in zonas:
-                mejor = mejores_tiendas[mejores_tiendas['Zona Geográfica'] == zona] if not mejores_tiendas.empty else pd.DataFrame()
-                peor = peores_tiendas[peores_tiendas['Zona Geográfica'] == zona] if not peores_tiendas.empty else pd.DataFrame()
-                
-                if not mejor.empty and not peor.empty:
-                    try:
-                        # Mostrar KPIs en formato de tarjeta HTML/CSS como Resumen General
-                        st.markdown(f"""
-                        <div class="kpi-group">
-                            <div class="kpi-group-title">{zona}</div>
-                            <div class="kpi-row">
-                                <div class="kpi-item">
-                                    <p class="small-font">Mejor Tienda</p>
-                                    <p class="metric-value">{mejor.iloc[0]['Tienda']}</p>
-                                    <p class="small-font">{mejor.iloc[0]['Cantidad']:,.0f} uds</p>
-                                    <p class="small-font" style="color:#059669;">{mejor.iloc[0]['Beneficio']:,.2f}€</p>
-                                </div>
-                                <div class="kpi-item">
-                                    <p class="small-font">Peor Tienda</p>
-                                    <p class="metric-value">{peor.iloc[0]['Tienda']}</p>
-                                    <p class="small-font">{peor.iloc[0]['Cantidad']:,.0f} uds ({peor.iloc[0]['%_vs_Media']}% vs media)</p>
-                                    <p class="small-font" style="color:#dc2626;">{peor.iloc[0]['Beneficio']:,.2f}€</p>
-                                </div>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    except Exception as e:
-                        st.error(f"Error al mostrar KPIs para {zona}: {str(e)}")
-                else:
-                    st.warning(f"No hay datos suficientes para mostrar KPIs de {zona}")
+                mejor = mejor_por_zona.get(zona)
+                peor = peor_por_zona.get(zona)
+                if mejor is None or peor is None:
+                    zonas_sin_datos.append(zona)
+                    continue
+                tarjetas_zona.append(ZONA_KPI_TEMPLATE.format(
+                    zona=zona,
+                    mejor_tienda=mejor.get('Tienda', 'Sin Asignar'),
+                    mejor_cantidad=mejor.get('Cantidad', 0),
+                    mejor_beneficio=mejor.get('Beneficio', 0.0),
+                    peor_tienda=peor.get('Tienda', 'Sin Asignar'),
+                    peor_cantidad=peor.get('Cantidad', 0),
+                    peor_pct=peor.get('%_vs_Media', 0.0),
+                    peor_beneficio=peor.get('Beneficio', 0.0)
+                ))
+            
+            if tarjetas_zona:
+                st.markdown("".join(tarjetas_zona), unsafe_allow_html=True)
+            for zona in zonas_sin_datos:
+                st.warning(f"No hay datos suficientes para mostrar KPIs de {zona}")
             
         except Exception as e:
             st.error(f"Error al procesar KPIs por zona: {str(e)}")
             st.info("Mostrando información básica de zonas...")
             
             # Fallback: mostrar información básica
-            zonas_basicas = df_ventas.groupby('Zona Geográfica')['Cantidad'].sum().reset_index()
-            st.dataframe(zonas_basicas, use_container_width=True)
+            st.dataframe(ventas_por_zona, use_container_width=True)
 
         # 2. Row: Ventas por zona y Tiendas por zona
         col1, col2 = st.columns(2)
         
         with col1:
             viz_title("Ventas por Zona")
-            fig = px.bar(ventas_por_zona, 
-                        x='Zona Geográfica', 
-                        y='Cantidad',
-                        color='Cantidad',
-                        color_continuous_scale=COLOR_GRADIENT,
-                        text='Cantidad')
-            fig.update_layout(
-                showlegend=False,
-                xaxis_tickangle=45,
-                margin=dict(t=30, b=0, l=0, r=0),
-                paper_bgcolor="rgba(0,0,0,0)",
-                plot_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_traces(opacity=0.8)
-            st.plotly_chart(fig, use_container_width=True)
+            # Figuras cacheadas: en reruns con los mismos agregados no se reconstruyen ni se reconvierten
+            st.plotly_chart(build_zona_bar_figure(ventas_por_zona, 'Cantidad'), use_container_width=True)
 
         with col2:
             viz_title("Tiendas por Zona")
-            fig = px.bar(tiendas_por_zona, 
-                        x='Zona Geográfica', 
-                        y='Tienda',
-                        color='Tienda',
-                        color_continuous_scale=COLOR_GRADIENT,
-                        text='Tienda')
-            fig.update_layout(
-                showlegend=False,
-                xaxis_tickangle=45,
-                margin=dict(t=30, b=0, l=0, r=0),
-                paper_bgcolor="rgba(0,0,0,0)",
-                plot_bgcolor="rgba(0,0,0,0)"
-            )
-            fig.update_traces(opacity=0.8)
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(build_zona_bar_figure(tiendas_por_zona, 'Tienda'), use_container_width=True)
 
         # 3. Row: Evolución mensual por zona
         viz_title("Evolución Mensual por Zona")
-        zona_mes_evol = df_ventas.groupby(['Mes', 'Zona Geográfica'])['Cantidad'].sum().reset_index()
-        fig = px.line(zona_mes_evol, 
-                     x='Mes', 
-                     y='Cantidad',
-                     color='Zona Geográfica',
-                     color_discrete_sequence=COLOR_GRADIENT)
-        fig.update_layout(
-            showlegend=True,
-            legend_title_text='Zona Geográfica',
-            xaxis_tickangle=45,
-            margin=dict(t=30, b=0, l=0, r=0),
-            paper_bgcolor="rgba(0,0,0,0)",
-            plot_bgcolor="rgba(0,0,0,0)"
-        )
-        fig.update_traces(opacity=0.8)
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(build_zona_mes_figure(zona_mes_evol), use_container_width=True)
 
         # 4. Row: Mapa España y tabla
         col3, col4 = st.columns(2)
@@ -2285,135 +1788,22 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         with col3:
             viz_title("Mapa de Ventas - España")
             
+            # Ventas por tienda incluyendo cantidad y ventas: una sola agregación, compartida por los mapas de España e Italia
+            ventas_por_tienda = df_ventas.groupby('Tienda', observed=True).agg({'Cantidad': 'sum', 'Beneficio': 'sum'}).reset_index()
+            ventas_por_tienda['Tienda'] = ventas_por_tienda['Tienda'].astype(str)
+            
             # Separar datos por país
-            TIENDAS_ITALIA = identificar_tiendas_italia(df_ventas)
-            df_espana = df_ventas[~df_ventas['Tienda'].isin(TIENDAS_ITALIA)].copy()
-            
-            tienda_a_coord = {
-                # --- EN ---
-                'EN02- VALENCIA ECI PINTOR SOROLLA': (39.4702, -0.3768),
-                'EN03- SANCHINARRO ECI': (40.4940, -3.6620),
-                'EN04- VITORIA ECI': (42.8467, -2.6716),
-                'EN05-ZARAGOZA': (41.6488, -0.8891),
-                'EN07- GOYA ECI': (40.4240, -3.6800),
-                'EN08- BILBAO ECI': (43.2630, -2.9350),
-                'EN09- LAS PALMAS MESA Y LOPEZ ECI': (28.1297, -15.4457),
-                'EN11- LEON ECI': (42.5987, -5.5671),
-                'EN13- CASTELLON ECI': (39.9864, -0.0513),
-                'EN14- CORUÑA ECI': (43.3623, -8.4115),
-                'EN15- VALLADOLID ECI': (41.6523, -4.7245),
-                'EN16- GIJON ECI': (43.5322, -5.6611),
-                'EN19- SANTANDER': (43.4623, -3.8099),
-                'EN24- 7 PALMAS -GRAN CANARIA EC': (28.1081, -15.4565),
-                'EN25- MALLORCA ECI NAELLE': (39.5712, 2.6490),
-                'EN26- VALENCIA AVDA.FRANCIA ECI NAELLE': (39.4615, -0.3400),
-                'EN27- VAGUADA ECI NAELLE': (40.4786, -3.7114),
-                'EN28- GRANADA GENIL ECI NAELLE': (37.1765, -3.5979),
-                'EN29- VIGO ECI NAELLE': (42.2406, -8.7207),
-                'EN30- PRINCESA ECI NAELLE': (40.4254, -3.7171),
-                'EN33- ALICANTE ECI NAELLE': (38.3452, -0.4810),
-                'EN34- PRECIADOS ECI NAELLE': (40.4180, -3.7040),
-                'EN35- VALLADOLID ZORRILLA ECI NAELLE': (41.6360, -4.7280),
-                'EN36- SEVILLA DUQUE ECI NAELLE': (37.3908, -5.9955),
-                'EN37- CORDOBA RONDA ECI NAELLE': (37.8882, -4.7794),
-                'EN38- CORDOBA TEJARES ECI NAELLE': (37.8882, -4.7794),
-                'EN39- ALBACETE ECI NAELLE': (38.9943, -1.8585),
-                'EN41- ECI DIAGONAL B ECI NAELLE': (41.3917, 2.1600),
-                'EN42- ECI MARBELLA ECI NAELLE': (36.5120, -4.8839),
-                'EN46- GRANADA ARABIAL ECI NAELLE': (37.1765, -3.5979),
-                'EN48- MENDEZ ALVARO NAELLE ECI': (40.3965, -3.6780),
-                'EN54- BADAJOZ CONQUISTADORES': (38.8786, -6.9703),
-                'EN62- ECI NAELLE BAHIA DE CADIZ': (36.5297, -6.2927),
-                'EN63- ECI NAELLE ALCALÁ DE HENARES': (40.4820, -3.3640),
-
-                # --- ET ---
-                'ET01- SANCHINARRO ECI TRUCCO': (40.4940, -3.6620),
-                'ET02- SEVILLA NERVION ECI TRUCCO': (37.3831, -5.9719),
-                'ET03- VIGO ECI TRUCCO': (42.2406, -8.7207),
-                'ET04- MALAGA ECI TRUCCO': (36.7213, -4.4214),
-                'ET05- CAMPO NACIONES MADRID ECI TRUCCO': (40.4517, -3.6167),
-                'ET06- VALENCIA-AVDA.FRANCIA ECI TRUCCO': (39.4615, -0.3400),
-                'ET07- ALCALA HENARES ECI TRUCCO': (40.4820, -3.3640),
-                'ET08-(0001) PRECIADOS ECI TRUCCO': (40.4180, -3.7040),
-                'ET09- LAS PALMAS ECI TRUCCO': (28.1297, -15.4457),
-                'ET11- MURCIA ECI TRUCCO': (37.9847, -1.1286),
-                'ET12- PRINCESA ECI TRUCCO': (40.4254, -3.7171),
-                'ET13- TENERIFE ECI TRUCCO': (28.4682, -16.2546),
-                'ET14- SAN JOSE DE VALDERAS CORTE INGLES': (40.3440, -3.7730),
-                'ET15- ARROYOMOLINOS XANADU ECI TRUCCO': (40.2740, -3.9170),
-                'ET16- EL BERCIAL ECI TRUCCO': (40.3175, -3.7317),
-                'ET17- SEVILLA DUQUE ECI TRUCCO': (37.3908, -5.9955),
-                'ET18- SEVILLA SAN JUAN ECI TRUCCO': (37.2830, -6.0090),
-                'ET19- GIJON ECI TRUCCO': (43.5322, -5.6611),
-                'ET20- SALAMANCA ECI TRUCCO': (40.9701, -5.6635),
-                'ET21- CARTAGENA ECI TRUCCO': (37.6257, -0.9966),
-                'ET24- GRANADA GENIL ECI TRUCCO': (37.1765, -3.5979),
-                'ET26- LEON ECI TRUCCO': (42.5987, -5.5671),
-                'ET29- CASTELLANA ECI TRUCCO': (40.4411, -3.6907),
-                'ET30- SOROLLA VALENCIA ECI TRUCCO': (39.4702, -0.3768),
-                'ET31- NUEVO CENTRO VALENCIA ECI TRUCCO': (39.4789, -0.3925),
-                'ET32- VITORIA ECI TRUCCO': (42.8467, -2.6716),
-                'ET33- ECI COSTA LUZ ECI TRUCCO': (36.5297, -6.2927),
-                'ET34- VALLADOLID ZORRILLA ECI TRUCCO': (41.6360, -4.7280),
-                'ET35- VALLADOLID CONSTITUCION ECI TRUCC': (41.6523, -4.7245),
-                'ET37- SANTIAGO ECI TRUCCO': (42.8804, -8.5456),
-                'ET38- GERONA-GIROCENTRE ECI TRUCCO': (41.9810, 2.8249),
-                'ET39- PUERTO VENECIA ECI TRUCCO': (41.6041, -0.8760),
-                'ET41- JAEN ECI TRUCCO': (37.7796, -3.7849),
-                'ET42- MALAGA BAHIA ECI TRUCCO': (36.7213, -4.4214),
-                'ET43- SANTANDER ECI TRUCCO': (43.4623, -3.8099),
-                'ET44- TARRAGONA ECI TRUCCO': (41.1189, 1.2445),
-                'ET45- SABADELL ECI TRUCCO': (41.5463, 2.1086),
-                'ET46- BADAJOZ CONQUISTADORES ECI TRUCCO': (38.8786, -6.9703),
-                'ET47- CAN DRAGO ECI TRUCCO': (41.4410, 2.1835),
-                'ET48- MENDEZ ALVARO ECI TRUCCO': (40.3965, -3.6780),
-                'ET49- ALBACETE ECI TRUCCO': (38.9943, -1.8585),
-                'ET50- JEREZ ECI TRUCCO': (36.6864, -6.1361),
-                'ET51- PARQUESUR ECI TRUCCO': (40.3394, -3.7632),
-                'ET52- VAGUADA ECI TRUCCO': (40.4786, -3.7114),
-                'ET53- CORDOBA ECI TRUCCO': (37.8882, -4.7794),
-                'ET54- CADIZ ECI TRUCCO': (36.5297, -6.2927),
-                'ET55- GRANADA ARABIAL ECI TRUCCO': (37.1765, -3.5979),
-                'ET56- PAMPLONA ECI TRUCCO': (42.8125, -1.6458),
-                'ET57- CASTELLÓN ECI TRUCCO': (39.9864, -0.0513),
-                'ET58- A CORUÑA-RAMON Y CAJAL ECI TRUCCO': (43.3623, -8.4115),
-                'ET61- BAHIA DE ALGECIRAS ECI TRUCCO': (36.1333, -5.4500),
-                'ET62- 7 PALMAS ECI TRUCCO': (28.1081, -15.4565),
-                'ET64- POZUELO ECI TRUCCO': (40.4361, -3.8136),
-                'ET66- CORDOBA TEJARES ECI TRUCCO': (37.8882, -4.7794),
-                'ET68- AVILES ECI TRUCCO': (43.5560, -5.9247),
-                'ET75- EL EJIDO TRUCCO ECI': (36.7763, -2.8146),
-
-                # --- F / P / R ---
-                'F087 CHAVES': (41.7403, -7.4689),
-                'F095  CIUDAD REAL': (38.9863, -3.9291),
-                'F097 BADAJOZ': (38.8786, -6.9703),
-                'P030 PAMPLONA': (42.8125, -1.6458),
-                'P032 FUENCARRAL': (40.4297, -3.7036),
-                'R010 ARTURO': (40.4483, -3.6900),
-                'R013 BILBAO': (43.2630, -2.9350),
-                'R018 PALACIO DE HIELO': (40.4631, -3.6370),
-                'R025 CASTELLANA': (40.4411, -3.6907),
-                'R026 JORGE JUAN': (40.4246, -3.6820),
-                'R028 PRINCESA': (40.4254, -3.7171)
-            }
-            # Asignar coordenadas según la tienda usando tu diccionario
-            df_espana['lat'] = df_espana['Tienda'].map(lambda t: tienda_a_coord.get(t, (None, None))[0])
-            df_espana['lon'] = df_espana['Tienda'].map(lambda t: tienda_a_coord.get(t, (None, None))[1])
-            
-            # Eliminar filas sin coordenadas
-            df_espana = df_espana.dropna(subset=['lat', 'lon'])
-
-            # Agrupar por tienda incluyendo cantidad y ventas
-            ventas_tienda_espana = df_espana.groupby(['Tienda', 'lat', 'lon']).agg({
-                'Cantidad': 'sum',
-                'Beneficio': 'sum'
-            }).reset_index()
+            TIENDAS_ITALIA = clasificar_tiendas(tuple(sorted(get_tiendas_unicas(df_ventas))))['italia']
+            
+            # Quitar las tiendas italianas y asignar coordenadas con un merge sobre la tabla de tiendas
+            # (inner: descarta las tiendas sin coordenadas)
+            ventas_tienda_espana = (
+                ventas_por_tienda[~ventas_por_tienda['Tienda'].isin(TIENDAS_ITALIA)]
+                .merge(COORDENADAS_TIENDAS, on='Tienda', how='inner')
+            )
             
-            # --- FIX: asegurar que 'Cantidad' no tenga valores negativos ni NaN ---
-            ventas_tienda_espana['Cantidad'] = pd.to_numeric(ventas_tienda_espana['Cantidad'], errors='coerce').fillna(0)
+            # Sin valores negativos en el tamaño de los puntos (Cantidad ya es numérica desde el preprocesado)
             ventas_tienda_espana['Cantidad'] = ventas_tienda_espana['Cantidad'].clip(lower=0)
-            # --- FIN FIX ---
 
             if not ventas_tienda_espana.empty:
                 fig_espana = px.scatter_mapbox(
@@ -2462,69 +1852,18 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             viz_title("Mapa de Ventas - Italia")
             
             # Identificar tiendas italianas de forma más robusta
-            # Buscar tiendas que contengan 'COIN' o que empiecen con 'I' (código de Italia)
-            tiendas_disponibles = df_ventas['Tienda'].dropna().unique()
-            tiendas_italianas = []
-            for tienda in tiendas_disponibles:
-                if 'COIN' in str(tienda) or str(tienda).startswith('I'):
-                    tiendas_italianas.append(tienda)
+            # Buscar tiendas que contengan 'COIN' o que empiecen con 'I' (código de Italia), con operaciones
+            # de texto vectorizadas sobre el resumen por tienda
+            nombres_tienda = ventas_por_tienda['Tienda']
+            es_italiana = nombres_tienda.str.contains('COIN', regex=False) | nombres_tienda.str.startswith('I')
             
-            # Separar datos por país
-            df_italia = df_ventas[df_ventas['Tienda'].isin(tiendas_italianas)].copy()
+            # Separar datos por país: ventas por tienda italiana, sin copiar las filas de ventas
+            df_italia = ventas_por_tienda[es_italiana].copy()
+            tiendas_italianas = df_italia['Tienda'].tolist()
             
             if not df_italia.empty:
-                # Crear un mapeo más robusto de tiendas a ciudades
-                mapeo_tienda_ciudad = {}
-                for tienda in tiendas_italianas:
-                    tienda_str = str(tienda).upper()
-                    
-                    # Mapeo directo por patrones específicos
-                    if 'BERGAMO' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'BERGAMO'
-                    elif 'VARESE' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'VARESE'
-                    elif 'BARICASAMASSIMA' in tienda_str or 'BARICASAMASSIMA' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'BARICASAMASSIMA'
-                    elif 'MILANO5GIORNATE' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'MILANO5GIORNATE'
-                    elif 'ROMACINECITTA' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'ROMACINECITTA'
-                    elif 'GENOVA' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'GENOVA'
-                    elif 'SASSARI' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'SASSARI'
-                    elif 'CATANIA' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'CATANIA'
-                    elif 'CAGLIARI' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'CAGLIARI'
-                    elif 'LECCE' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'LECCE'
-                    elif 'MILANOCANTORE' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'MILANOCANTORE'
-                    elif 'MESTRE' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'MESTRE'
-                    elif 'PADOVA' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'PADOVA'
-                    elif 'FIRENZE' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'FIRENZE'
-                    elif 'ROMASANGIOVANNI' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'ROMASANGIOVANNI'
-                    elif 'MILANO' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'MILANO'
-                    elif 'TRUCCOONLINEB2C' in tienda_str:
-                        mapeo_tienda_ciudad[tienda] = 'ONLINE'
-                    else:
-                        # Intentar extraer con regex como fallback
-                        ciudad_extraida = df_italia[df_italia['Tienda'] == tienda]['Tienda'].str.extract(r'I\d{3}COIN([A-Z]+)', expand=False).iloc[0]
-                        if pd.notna(ciudad_extraida):
-                            mapeo_tienda_ciudad[tienda] = ciudad_extraida
-                        else:
-                            # Usar el nombre de la tienda sin prefijos
-                            ciudad_limpia = tienda_str.replace('I301COIN', '').replace('I302COIN', '').replace('I303COIN', '').replace('I304COIN', '').replace('I305COIN', '').replace('I306COIN', '').replace('I309COIN', '').replace('I314COIN', '').replace('I315COIN', '').replace('I316COIN', '').replace('I317COIN', '').replace('I318COIN', '').replace('I319COIN', '').replace('I320COIN', '').replace('I321COIN', '').replace('(TRUCCO)', '').replace('TRUCCOONLINEB2C', 'ONLINE')
-                            mapeo_tienda_ciudad[tienda] = ciudad_limpia
-                
-                # Aplicar el mapeo
-                df_italia['Ciudad'] = df_italia['Tienda'].map(mapeo_tienda_ciudad)
+                # Ciudad de cada tienda, deducida una vez sobre las tiendas distintas y aplicada con un map
+                df_italia['Ciudad'] = df_italia['Tienda'].map(ciudad_tiendas_italia(tiendas_italianas))
 
                 coordenadas_italia = {
                     'BERGAMO': (45.6983, 9.6773),
@@ -2552,13 +1891,12 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 df_italia = df_italia.dropna(subset=['lat', 'lon'])
 
                 # Agrupar por ciudad incluyendo tanto cantidad como ventas en euros
-                ventas_ciudad_italia = df_italia.groupby(['Ciudad', 'lat', 'lon']).agg({
+                ventas_ciudad_italia = df_italia.groupby(['Ciudad', 'lat', 'lon'], observed=True).agg({
                     'Cantidad': 'sum',
                     'Beneficio': 'sum'
                 }).reset_index()
                 
-                # Asegurar que 'Cantidad' no tenga valores negativos ni NaN para el mapa de Italia
-                ventas_ciudad_italia['Cantidad'] = pd.to_numeric(ventas_ciudad_italia['Cantidad'], errors='coerce').fillna(0)
+                # Sin valores negativos en el tamaño de los puntos (Cantidad ya es numérica desde el preprocesado)
                 ventas_ciudad_italia['Cantidad'] = ventas_ciudad_italia['Cantidad'].clip(lower=0)
                 
                 if not ventas_ciudad_italia.empty:
@@ -2604,10 +1942,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 st.write("**Tiendas Italianas Encontradas**")
                 st.caption("Se encontraron tiendas italianas pero no se pudieron mapear a coordenadas.")
                 st.dataframe(
-                    df_italia[['Tienda', 'Cantidad', 'Beneficio']].groupby('Tienda').agg({
-                        'Cantidad': 'sum',
-                        'Beneficio': 'sum'
-                    }).reset_index().style.format({
+                    df_italia[['Tienda', 'Cantidad', 'Beneficio']].style.format({
                         'Cantidad': '{:,.0f}',
                         'Beneficio': '{:,.2f}€'
                     }),
@@ -2627,7 +1962,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             if not ventas.empty:
                 ventas['Precio Real Unitario'] = ventas['Beneficio'] / ventas['Cantidad']
                 # Evitar división por cero
-                ventas['Descuento Real %'] = 0
+                ventas['Descuento Real %'] = 0.0
                 mask = (ventas['PVP'] != 0) & (ventas['Precio Real Unitario'].notna())
                 ventas.loc[mask, 'Descuento Real %'] = (
                     (ventas.loc[mask, 'PVP'] - ventas.loc[mask, 'Precio Real Unitario']) / 
@@ -2643,12 +1978,12 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         tienda_mas_devoluciones = "Sin datos"
         ratio_devolucion_valor = 0
         if not devoluciones.empty:
-            devoluciones_por_tienda = devoluciones.groupby('Tienda').agg({'Cantidad': 'sum'}).reset_index()
+            devoluciones_por_tienda = devoluciones.groupby('Tienda', observed=True).agg({'Cantidad': 'sum'}).reset_index()
             devoluciones_por_tienda['Cantidad'] = abs(devoluciones_por_tienda['Cantidad'])
             devoluciones_por_tienda = devoluciones_por_tienda.sort_values('Cantidad', ascending=False)
             
             # Calcular ratio de devolución por tienda
-            ventas_por_tienda = ventas.groupby('Tienda')['Cantidad'].sum().reset_index()
+            ventas_por_tienda = ventas.groupby('Tienda', observed=True)['Cantidad'].sum().reset_index()
             ratio_devolucion = ventas_por_tienda.merge(devoluciones_por_tienda, on='Tienda', how='left')
             ratio_devolucion['Cantidad_y'] = ratio_devolucion['Cantidad_y'].fillna(0)
             ratio_devolucion['Ratio Devolución %'] = (ratio_devolucion['Cantidad_y'] / ratio_devolucion['Cantidad_x'] * 100).round(2)
@@ -2662,7 +1997,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         talla_mas_devuelta = "Sin datos"
         talla_devuelta_unidades = 0
         if not devoluciones.empty and 'Talla' in devoluciones.columns:
-            talla_mas_devuelta_data = devoluciones.groupby('Talla')['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
+            talla_mas_devuelta_data = devoluciones.groupby('Talla', observed=True)['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
             if not talla_mas_devuelta_data.empty:
                 talla_mas_devuelta = talla_mas_devuelta_data.index[0]
                 talla_devuelta_unidades = talla_mas_devuelta_data.iloc[0]
@@ -2671,7 +2006,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         familia_mas_devuelta = "Sin datos"
         familia_devuelta_unidades = 0
         if not devoluciones.empty:
-            familia_mas_devuelta_data = devoluciones.groupby('Familia')['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
+            familia_mas_devuelta_data = devoluciones.groupby('Familia', observed=True)['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
             if not familia_mas_devuelta_data.empty:
                 familia_mas_devuelta = familia_mas_devuelta_data.index[0]
                 familia_devuelta_unidades = familia_mas_devuelta_data.iloc[0]
@@ -2694,15 +2029,14 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     return f"I{año+1}"
 
         if 'Fecha venta' in df_ventas.columns:
-            df = df_ventas.copy()
-            df['Fecha venta'] = pd.to_datetime(df['Fecha venta'], errors='coerce')
-            df = df[df['Cantidad'] > 0]  # solo ventas positivas
+            # Fecha venta ya es datetime desde el preprocesado; se copian solo las ventas positivas
+            df = df_ventas[df_ventas['Cantidad'] > 0].copy()
             df['mes'] = df['Fecha venta'].dt.month
             
             # Calcular precio real unitario y descuento
             df['Precio Real Unitario'] = df['Beneficio'] / df['Cantidad']
             mask = (df['PVP'] != 0) & (df['Precio Real Unitario'].notna())
-            df['Descuento Real %'] = 0
+            df['Descuento Real %'] = 0.0
             df.loc[mask, 'Descuento Real %'] = (
                 (df.loc[mask, 'PVP'] - df.loc[mask, 'Precio Real Unitario']) /
                 df.loc[mask, 'PVP'] * 100
@@ -2850,10 +2184,10 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         
         if not devoluciones.empty:
             # Preparar datos para comparación
-            ventas_por_familia = ventas.groupby('Familia')['Cantidad'].sum().reset_index()
+            ventas_por_familia = ventas.groupby('Familia', observed=True)['Cantidad'].sum().reset_index()
             ventas_por_familia['Tipo'] = 'Ventas'
             
-            devoluciones_por_familia = devoluciones.groupby('Familia')['Cantidad'].sum().reset_index()
+            devoluciones_por_familia = devoluciones.groupby('Familia', observed=True)['Cantidad'].sum().reset_index()
             devoluciones_por_familia['Cantidad'] = abs(devoluciones_por_familia['Cantidad'])
             devoluciones_por_familia['Tipo'] = 'Devoluciones'
             
@@ -2888,7 +2222,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         
         if not devoluciones.empty and 'Talla' in devoluciones.columns:
             # Obtener datos de tallas por familia
-            tallas_por_familia = devoluciones.groupby(['Familia', 'Talla'])['Cantidad'].sum().abs().reset_index()
+            tallas_por_familia = devoluciones.groupby(['Familia', 'Talla'], observed=True)['Cantidad'].sum().abs().reset_index()
             
             # Crear tablas para cada familia
             familias_unicas = tallas_por_familia['Familia'].unique()
@@ -2992,7 +2326,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             df_ventas_temp['vendido_fuera_temporada'] = df_ventas_temp.apply(vendido_fuera_temporada, axis=1)
             
             # Agrupar por temporada y tipo de venta
-            analisis_temporada = df_ventas_temp.groupby(['Temporada', 'vendido_fuera_temporada'])['Cantidad'].sum().reset_index()
+            analisis_temporada = df_ventas_temp.groupby(['Temporada', 'vendido_fuera_temporada'], observed=True)['Cantidad'].sum().reset_index()
             analisis_temporada['Tipo_Venta'] = analisis_temporada['vendido_fuera_temporada'].map({
                 0: 'En Temporada',
                 1: 'Fuera de Temporada'
@@ -3025,7 +2359,8 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 index='Temporada',
                 columns='Tipo_Venta',
                 values='Cantidad',
-                fill_value=0
+                fill_value=0,
+                observed=True
             ).reset_index()
             # Asegurar que ambas columnas existen
             for col in ['En Temporada', 'Fuera de Temporada']:
@@ -3178,13 +2513,12 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             df_ventas_filtrado = df_ventas_filtrado[df_ventas_filtrado['Familia'] == familia_seleccionada]
         
         # Preparar datos - agrupar por código sin el último carácter (talla)
-        df_ventas_filtrado['Código único'] = df_ventas_filtrado['Código único'].astype(str).str.strip()
         df_ventas_filtrado['Código base'] = df_ventas_filtrado['Código único'].str[:-1]  # Excluir último carácter (talla)
         
         # Top 20 productos más vendidos
         st.markdown("### 📈 **Top 20 Productos Más Vendidos**")
         if len(df_ventas_filtrado) > 0:
-            top_ventas = df_ventas_filtrado.groupby(['Código base', 'Familia']).agg({
+            top_ventas = df_ventas_filtrado.groupby(['Código base', 'Familia'], observed=True).agg({
                 'Cantidad': 'sum',
                 'url_image': 'first'
             }).reset_index()
@@ -3224,7 +2558,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         # Top 20 productos menos vendidos
         st.markdown("### 📉 **Top 20 Productos Menos Vendidos**")
         if len(df_ventas_filtrado) > 0:
-            menos_ventas = df_ventas_filtrado.groupby(['Código base', 'Familia']).agg({
+            menos_ventas = df_ventas_filtrado.groupby(['Código base', 'Familia'], observed=True).agg({
                 'Cantidad': 'sum',
                 'url_image': 'first'
             }).reset_index()
@@ -3267,25 +2601,278 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
 @st.cache_data
 def calculate_store_rankings(df_ventas):
     """Cache the store ranking calculations"""
-    ventas_por_tienda = df_ventas.groupby('Tienda').agg({
+    ventas_por_tienda = df_ventas.groupby('Tienda', observed=True).agg({
         'Cantidad': 'sum',
         'Beneficio': 'sum'
     }).reset_index()
     ventas_por_tienda.columns = ['Tienda', 'Unidades Vendidas', 'Beneficio']
     
-    # Ordenar por Beneficio para obtener el ranking
-    ventas_por_tienda = ventas_por_tienda.sort_values('Beneficio', ascending=False).reset_index(drop=True)
-    ventas_por_tienda['Ranking'] = ventas_por_tienda.index + 1
+    # Ranking por Beneficio (1..N, empates por orden de tienda) sin reordenar todo el DataFrame: las filas
+    # quedan por tienda, así que cada vista ordena o selecciona por 'Ranking' (sort_values/nsmallest/nlargest)
+    ventas_por_tienda['Ranking'] = ventas_por_tienda['Beneficio'].rank(method='first', ascending=False).astype('int32')
     return ventas_por_tienda
 
+@st.cache_data(show_spinner=False)
+def build_ranking_tiendas_figure(ranking):
+    """Cache the Plotly bar chart for a top/bottom 30 store ranking slice"""
+    fig = px.bar(
+        ranking,
+        x='Tienda',
+        y='Beneficio',
+        color='Beneficio',
+        color_continuous_scale=COLOR_GRADIENT,
+        height=400,
+        labels={'Tienda': 'Tienda', 'Beneficio': 'Beneficio', 'Unidades Vendidas': 'Unidades'}
+    )
+    fig.update_layout(
+        xaxis_tickangle=45,
+        showlegend=False,
+        margin=dict(t=0, b=0, l=0, r=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    fig.update_traces(
+        texttemplate='%{y:,.2f}€',
+        textposition='outside',
+        hovertemplate="Tienda: %{x}<br>Ventas: %{y:,.2f}€<br>Unidades: %{customdata:,}<extra></extra>",
+        customdata=ranking['Unidades Vendidas'],
+        opacity=0.8
+    )
+    return fig
+
+@st.cache_data(show_spinner=False)
+def build_zona_bar_figure(datos_zona, columna):
+    """Cache the per-zona bar chart (units sold or number of tiendas), built from NumPy arrays with go.Bar"""
+    zonas = datos_zona['Zona Geográfica'].astype(str).to_numpy()
+    valores = datos_zona[columna].to_numpy()
+    fig = go.Figure(go.Bar(
+        x=zonas,
+        y=valores,
+        text=valores,
+        marker=dict(color=valores, colorscale=COLOR_GRADIENT, showscale=True, colorbar=dict(title=columna)),
+        hovertemplate=f"Zona Geográfica: %{{x}}<br>{columna}: %{{y:,}}<extra></extra>",
+        opacity=0.8
+    ))
+    fig.update_layout(
+        showlegend=False,
+        xaxis_title='Zona Geográfica',
+        yaxis_title=columna,
+        xaxis_tickangle=45,
+        margin=dict(t=30, b=0, l=0, r=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    return fig
+
+@st.cache_data(show_spinner=False)
+def build_zona_mes_figure(zona_mes_evol):
+    """Cache the monthly units line chart with one line per zona"""
+    fig = px.line(zona_mes_evol, 
+                 x='Mes', 
+                 y='Cantidad',
+                 color='Zona Geográfica',
+                 color_discrete_sequence=COLOR_GRADIENT)
+    fig.update_layout(
+        showlegend=True,
+        legend_title_text='Zona Geográfica',
+        xaxis_tickangle=45,
+        margin=dict(t=30, b=0, l=0, r=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    fig.update_traces(opacity=0.8)
+    return fig
+
+@st.cache_data(show_spinner=False)
+def build_enviado_ventas_figure(datos_comparacion, titulo):
+    """Cache the grouped bar chart of units sent from the warehouse vs units sold per talla"""
+    # Dos series alineadas por talla: dos go.Bar directos, sin DataFrame largo intermedio
+    tallas = datos_comparacion['Talla'].astype(str).to_numpy()
+    series = {
+        'Enviado Almacén': (datos_comparacion['Cantidad pedida'].to_numpy(), '#800080'),
+        'Ventas': (datos_comparacion['Cantidad'].to_numpy(), '#000080'),
+    }
+    fig = go.Figure([
+        go.Bar(name=tipo, x=tallas, y=valores, text=valores, marker_color=color)
+        for tipo, (valores, color) in series.items()
+    ])
+
+    # Altura dinámica según la cantidad de tallas: entre 400 y 800px
+    altura_dinamica = max(400, min(800, len(datos_comparacion) * 50))
+    # Rango dinámico eje Y: 10% de margen sobre el máximo
+    max_cantidad = max(valores.max() for valores, _ in series.values()) if len(tallas) else 0
+    y_max = float(max_cantidad) * 1.1 if max_cantidad > 0 else 100
+
+    fig.update_layout(
+        title=titulo,
+        height=altura_dinamica,
+        xaxis_title="Talla",
+        yaxis_title="Cantidad",
+        legend_title_text="Tipo",
+        barmode="group",
+        margin=dict(t=30, b=0, l=0, r=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        xaxis=dict(type='category', categoryorder='array', categoryarray=tallas),
+        yaxis=dict(
+            range=[0, y_max],
+            showgrid=True,
+            gridcolor='rgba(0,0,0,0.1)'
+        )
+    )
+    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
+    return fig
+
+@st.cache_data(show_spinner=False)
+def build_tallas_figure(df_tallas, ordenes, temporada_colors):
+    """Cache the stacked sizes chart with one facet per size type (ordenes: tipo -> ordered tallas)"""
+    altura = max(max(400, min(800, len(orden) * 50)) for orden in ordenes.values())
+    fig = px.bar(
+        df_tallas,
+        x='Talla',
+        y='Cantidad',
+        color='Temporada',
+        text='Cantidad',
+        facet_col='Tipo_Talla',
+        category_orders={'Tipo_Talla': list(ordenes)},
+        color_discrete_map=temporada_colors,
+        height=altura
+    )
+    fig.update_layout(
+        barmode="stack",
+        margin=dict(t=30, b=0, l=0, r=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)"
+    )
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split('=')[-1]))
+    fig.update_xaxes(matches=None, title_text="Talla", showticklabels=True)
+    fig.update_yaxes(matches=None, showgrid=True, gridcolor='rgba(0,0,0,0.1)')
+    fig.update_yaxes(title_text="Unidades Vendidas", col=1)
+    # Cada faceta con su propio orden de tallas y su propio rango vertical
+    max_por_tipo = df_tallas.groupby('Tipo_Talla', observed=True)['Cantidad'].max()
+    for col_idx, (tipo, orden) in enumerate(ordenes.items(), start=1):
+        max_cantidad = max_por_tipo.get(tipo, 0)
+        y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
+        fig.update_xaxes(categoryorder='array', categoryarray=orden, col=col_idx)
+        fig.update_yaxes(range=[0, y_max], showticklabels=True, col=col_idx)
+    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
+    return fig
+
+# Cached lookup Código único -> Precio Coste
+@st.cache_data
+def build_precio_map(df_productos):
+    """Cache the Precio Coste lookup by Código único (first known price per code)"""
+    if 'Código único' not in df_productos.columns or 'Precio Coste' not in df_productos.columns:
+        return {}
+    # Un precio por código a propósito: el antiguo merge duplicaba cada venta por cada pedido del mismo
+    # código e inflaba las sumas de Cantidad/Beneficio del análisis de márgenes
+    precios = (
+        df_productos.dropna(subset=['Precio Coste'])
+        .drop_duplicates('Código único')
+        .set_index('Código único')['Precio Coste']
+    )
+    return precios.to_dict()
+
+@st.cache_data
+def build_familia_map(df_ventas):
+    """Cache the Familia lookup by Código único (first sale per code); codes without Familia are left out"""
+    familias = df_ventas.drop_duplicates('Código único').set_index('Código único')['Familia']
+    # Sin los nulos: astype(str) los convertiría en 'nan' y el fillna('Sin Familia') del map no se aplicaría
+    return familias.dropna().astype(str).to_dict()
+
 # Cached function for calculating family rankings per store
 @st.cache_data
-def calculate_family_rankings(df_ventas):
-    """Cache the family ranking calculations per store"""
-    familias_por_tienda = df_ventas.groupby(['Tienda', 'Familia'])['Cantidad'].sum().reset_index()
+def calculate_family_rankings(_df_ventas, huella):
+    """Cache the family ranking calculations per store (keyed by dataframe_fingerprint, not by hashing the frame)"""
+    familias_por_tienda = _df_ventas.groupby(['Tienda', 'Familia'], observed=True)['Cantidad'].sum().reset_index()
     familias_por_tienda = familias_por_tienda.sort_values('Cantidad', ascending=False)
     return familias_por_tienda
 
+@st.cache_data(show_spinner=False)
+def calculate_tema_aggregates(df_almacen_tema):
+    """Cache the per-tema warehouse aggregates shared by every 'Entrada Almacén' panel"""
+    # Un único recorrido de las filas por (tema, mes, talla); el total por (tema, talla) sale de re-agregar
+    # ese resultado, ya pequeño (todas las filas tienen Mes Entrada)
+    por_mes = df_almacen_tema.groupby(['Tema_temporada', 'Mes Entrada', 'Talla'], observed=True)['Cantidad pedida'].sum()
+    enviado_talla_por_tema = por_mes.groupby(level=['Tema_temporada', 'Talla'], observed=True).sum()
+    return {
+        'codigos_por_tema': df_almacen_tema.groupby('Tema_temporada', observed=True, sort=False)['Código único'].unique(),
+        'enviado_talla_por_tema': enviado_talla_por_tema,
+        'temas_con_entradas': set(enviado_talla_por_tema.index.get_level_values('Tema_temporada')),
+        # Tabla Mes Entrada x Talla de todos los temas con un solo unstack
+        'entradas_mes_talla': por_mes.unstack('Talla', fill_value=0),
+    }
+
+@st.cache_data(show_spinner=False)
+def calculate_ventas_temporada_codigo_talla(_df_ventas, huella):
+    """Cache the units sold per (Temporada, Código único, Talla), keyed by dataframe_fingerprint, not by hashing the frame"""
+    return _df_ventas.groupby(['Temporada', 'Código único', 'Talla'], observed=True)['Cantidad'].sum()
+
+@st.cache_data(show_spinner=False)
+def calculate_ventas_talla_tema(_df_ventas, huella, temporada, codigos):
+    """Cache the units sold per talla for one tema: ventas of its temporada restricted to the tema's codes"""
+    ventas = calculate_ventas_temporada_codigo_talla(_df_ventas, huella)
+    # Índice ordenado: la temporada es un corte directo; el resto trabaja sobre datos ya agregados
+    try:
+        ventas_temporada = ventas.loc[temporada]
+    except KeyError:
+        return pd.Series(dtype=ventas.dtype, name='Cantidad')
+    ventas_tema = ventas_temporada[ventas_temporada.index.get_level_values('Código único').isin(codigos)]
+    return ventas_tema.groupby(level='Talla', observed=True).sum()
+
+@st.cache_data(show_spinner=False)
+def calculate_zona_aggregates(_df_ventas, huella):
+    """Cache the per-zona totals of the Geográfico y Tiendas section: units, number of tiendas and monthly evolution"""
+    ventas_por_zona = _df_ventas.groupby('Zona Geográfica', observed=True)['Cantidad'].sum().reset_index()
+    tiendas_por_zona = (
+        _df_ventas[['Tienda', 'Zona Geográfica']].drop_duplicates()
+        .groupby('Zona Geográfica', observed=True).count().reset_index()
+    )
+    zona_mes_evol = _df_ventas.groupby(['Mes', 'Zona Geográfica'], observed=True)['Cantidad'].sum().reset_index()
+    return ventas_por_zona, tiendas_por_zona, zona_mes_evol
+
+@st.cache_data(show_spinner=False)
+def calculate_ventas_tienda_zona(_df_ventas, huella):
+    """Cache the units and profit per (zona, tienda) with the zona mean and each tienda's % vs that mean"""
+    ventas_tienda_zona = _df_ventas.groupby(['Zona Geográfica', 'Tienda'], observed=True).agg({
+        'Cantidad': 'sum',
+        'Beneficio': 'sum'
+    }).reset_index()
+
+    # Limpiar nombres de tiendas problemáticos
+    ventas_tienda_zona['Tienda'] = ventas_tienda_zona['Tienda'].astype(str)
+    ventas_tienda_zona['Tienda'] = ventas_tienda_zona['Tienda'].replace({
+        'COMODIN': 'Sin Asignar',
+        'nan': 'Sin Asignar',
+        'None': 'Sin Asignar',
+        '': 'Sin Asignar'
+    })
+
+    # Asegurar que Zona Geográfica es string
+    ventas_tienda_zona['Zona Geográfica'] = ventas_tienda_zona['Zona Geográfica'].astype(str)
+
+    # Media de ventas de la zona en cada fila (transform: sin tabla intermedia ni merge)
+    ventas_tienda_zona['Media_Zona'] = ventas_tienda_zona.groupby('Zona Geográfica', observed=True)['Cantidad'].transform('mean')
+
+    # Calcular porcentaje vs media con manejo de división por cero (una sola expresión NumPy sobre la columna)
+    cantidad = ventas_tienda_zona['Cantidad'].to_numpy(dtype='float64')
+    media = ventas_tienda_zona['Media_Zona'].to_numpy(dtype='float64')
+    ventas_tienda_zona['%_vs_Media'] = np.round(
+        np.divide(cantidad - media, media, out=np.zeros_like(cantidad), where=media > 0) * 100.0, 1
+    )
+
+    return ventas_tienda_zona
+
+@st.cache_data(show_spinner=False)
+def calculate_pendientes_por_talla(df_pendientes):
+    """Cache the pending-delivery units per talla, already in talla order"""
+    return ordenar_por_talla(
+        df_pendientes.groupby(['Talla'], observed=True)['Cantidad pedida']
+        .sum()
+        .reset_index()
+        .rename(columns={'Cantidad pedida': 'Cantidad Pendiente'})
+    )
+
 @st.cache_data
 def preprocess_ventas_data(df_ventas):
     """Cache the data preprocessing to avoid reprocessing on every interaction - OPTIMIZED VERSION"""
@@ -3323,9 +2910,9 @@ def preprocess_ventas_data(df_ventas):
     
     # OPTIMIZATION: Process date column more efficiently
     if 'Fecha venta' in df_ventas.columns:
-        df_ventas['Fecha venta'] = pd.to_datetime(df_ventas['Fecha venta'], format='%d/%m/%Y', errors='coerce')
+        df_ventas['Fecha venta'] = parse_fechas(df_ventas['Fecha venta'])
         df_ventas = df_ventas.dropna(subset=['Fecha venta'])
-        df_ventas['Mes'] = df_ventas['Fecha venta'].dt.to_period('M').astype(str)
+        df_ventas['Mes'] = formatear_mes(df_ventas['Fecha venta'])
 
     # OPTIMIZATION: Process code columns more efficiently
     if 'Código único' in df_ventas.columns:
@@ -3335,6 +2922,10 @@ def preprocess_ventas_data(df_ventas):
     if 'Tienda' in df_ventas.columns:
         df_ventas['Tienda'] = df_ventas['Tienda'].astype(str).str.strip()
     
+    # Tallas normalizadas una sola vez: los cruces por talla comparan valores ya limpios
+    if 'Talla' in df_ventas.columns:
+        df_ventas['Talla'] = limpiar_espacios(df_ventas['Talla'])
+
     if 'Familia' in df_ventas.columns:
         df_ventas['Familia'] = df_ventas['Familia'].fillna("Sin Familia")
     
@@ -3343,7 +2934,12 @@ def preprocess_ventas_data(df_ventas):
     for col in numeric_columns:
         if col in df_ventas.columns:
             df_ventas[col] = pd.to_numeric(df_ventas[col], errors='coerce').fillna(0)
-    
+
+    # OPTIMIZATION: Reducir el ancho de las columnas numéricas (menos memoria por cada groupby/filtro).
+    # Beneficio y PVP se mantienen en float64 para no perder precisión en los importes en euros.
+    if 'Cantidad' in df_ventas.columns:
+        df_ventas['Cantidad'] = reducir_a_int32(df_ventas['Cantidad'])
+
     # OPTIMIZATION: Handle color column more efficiently
     if 'Color' not in df_ventas.columns:
         df_ventas['Color'] = 'Desconocido'
@@ -3366,7 +2962,22 @@ def preprocess_ventas_data(df_ventas):
 
     #Eliminar tiendas problemáticas
     df_ventas = df_ventas[~df_ventas["Tienda"].isin(tiendas_a_eliminar)]
-    
+
+    # Columnas de baja cardinalidad como category: groupby/isin/nunique trabajan sobre códigos enteros
+    for col in ['Tienda', 'Familia', 'Temporada', 'Código Tienda', 'Zona Geográfica', 'Talla']:
+        if col in df_ventas.columns:
+            df_ventas[col] = df_ventas[col].astype('category')
+    if 'Talla' in df_ventas.columns:
+        df_ventas['Talla'] = categoria_tallas(df_ventas['Talla'])
+    # Meses 'YYYY-MM' como category ordenada: el orden del texto es el cronológico, así que max() sigue
+    # devolviendo el último mes, y los groupby por mes trabajan sobre códigos
+    if 'Mes' in df_ventas.columns:
+        meses = sorted(df_ventas['Mes'].dropna().unique())
+        df_ventas['Mes'] = df_ventas['Mes'].astype(pd.CategoricalDtype(meses, ordered=True))
+
+    # Huella calculada una sola vez por carga; sirve de clave para los filtros cacheados
+    dataframe_fingerprint(df_ventas)
+
     return df_ventas
 
 # Cached function for data preprocessing
@@ -3407,8 +3018,8 @@ def preprocess_productos_data(df_productos):
     
     # OPTIMIZATION: Process date column more efficiently
     if 'Fecha almacén' in df_productos.columns:
-        # Intentar múltiples formatos de fecha para mayor compatibilidad
-        df_productos['Fecha almacén'] = pd.to_datetime(df_productos['Fecha almacén'], errors='coerce')
+        # Formato dd/mm/yyyy y, para el resto, parser flexible sobre valores únicos
+        df_productos['Fecha almacén'] = parse_fechas(df_productos['Fecha almacén'])
         
         # Si hay fechas que no se pudieron convertir, mostrar información de debug
         fechas_invalidas = df_productos['Fecha almacén'].isna().sum()
@@ -3421,7 +3032,7 @@ def preprocess_productos_data(df_productos):
         df_productos = df_productos.dropna(subset=['Fecha almacén'])
         
         # Crear columna de mes
-        df_productos['Mes'] = df_productos['Fecha almacén'].dt.to_period('M').astype(str)
+        df_productos['Mes'] = formatear_mes(df_productos['Fecha almacén'])
         
         # Debug: mostrar los meses únicos encontrados
         meses_unicos = sorted(df_productos['Mes'].unique())
@@ -3431,12 +3042,18 @@ def preprocess_productos_data(df_productos):
     if 'Código único' in df_productos.columns:
         df_productos['Código único'] = df_productos['Código único'].astype(str).str.strip()
 
+    if 'Talla' in df_productos.columns:
+        df_productos['Talla'] = limpiar_espacios(df_productos['Talla'])
     
     # OPTIMIZATION: Process numeric columns more efficiently
     numeric_columns = ['Cantidad pedida', 'PVP']
     for col in numeric_columns:
         if col in df_productos.columns:
             df_productos[col] = pd.to_numeric(df_productos[col], errors='coerce').fillna(0)
+
+    # Unidades pedidas como int32 (PVP se queda en float64)
+    if 'Cantidad pedida' in df_productos.columns:
+        df_productos['Cantidad pedida'] = reducir_a_int32(df_productos['Cantidad pedida'])
     
     # OPTIMIZATION: Process theme column more efficiently
     if 'Tema' in df_productos.columns:
@@ -3453,8 +3070,11 @@ def preprocess_productos_data(df_productos):
         })
         
         # Take first 6 characters only for valid themes
-        mask_valid = ~df_productos['Tema_temporada'].isin(['Sin Tema', 'nan', 'None'])
+        mask_valid = ~df_productos['Tema_temporada'].isin(TEMAS_INVALIDOS)
         df_productos.loc[mask_valid, 'Tema_temporada'] = df_productos.loc[mask_valid, 'Tema_temporada'].str[:6]
+
+        # Pocos temas distintos: como category, los filtros y groupby por tema trabajan sobre códigos
+        df_productos['Tema_temporada'] = df_productos['Tema_temporada'].astype('category')
     
     # OPTIMIZATION: Handle color column more efficiently
     if 'Color' not in df_productos.columns:
@@ -3495,32 +3115,42 @@ def preprocess_traspasos_data(df_traspasos):
   
     # OPTIMIZATION: Process date column more efficiently
     if 'Fecha enviado' in df_traspasos.columns:
-        # Intentar diferentes formatos de fecha para ser más flexible
-        try:
-            # Primero intentar con el formato exacto dd/mm/yyyy
-            df_traspasos['Fecha enviado'] = pd.to_datetime(df_traspasos['Fecha enviado'], format='%d/%m/%Y', errors='coerce')
-        except:
-            try:
-                # Si falla, intentar con formato más flexible
-                df_traspasos['Fecha enviado'] = pd.to_datetime(df_traspasos['Fecha enviado'], dayfirst=True, errors='coerce')
-            except:
-                # Si todo falla, usar el parser automático
-                df_traspasos['Fecha enviado'] = pd.to_datetime(df_traspasos['Fecha enviado'], errors='coerce')
-        
+        # Formato dd/mm/yyyy y, para el resto, parser flexible sobre valores únicos
+        df_traspasos['Fecha enviado'] = parse_fechas(df_traspasos['Fecha enviado'])
+
         df_traspasos = df_traspasos.dropna(subset=['Fecha enviado'])
-        df_traspasos['Mes'] = df_traspasos['Fecha enviado'].dt.to_period('M').astype(str)
+        df_traspasos['Mes'] = formatear_mes(df_traspasos['Fecha enviado'])
 
     # OPTIMIZATION: Process code columns more efficiently
     if 'Código único' in df_traspasos.columns:
         df_traspasos['Código único'] = df_traspasos['Código único'].astype(str).str.strip()
+
+    if 'Talla' in df_traspasos.columns:
+        df_traspasos['Talla'] = categoria_tallas(limpiar_espacios(df_traspasos['Talla']))
+    
+    # Temporada normalizada una sola vez al formato de ventas (5 caracteres, p. ej. "O2025")
+    if 'Temporada' in df_traspasos.columns:
+        temporada = df_traspasos['Temporada']
+    else:
+        temporada_columns = [col for col in df_traspasos.columns if 'temporada' in col.lower() or 'season' in col.lower()]
+        if temporada_columns:
+            temporada = df_traspasos[temporada_columns[0]]
+        else:
+            temporada = pd.Series(np.nan, index=df_traspasos.index, dtype=object)
+    # astype('string') antes de .str: una columna numérica o toda NaN (habitual al leer el Excel) no rompe el preprocesado
+    df_traspasos['Temporada'] = (
+        temporada.astype('string').str.strip().str[:5].fillna('Sin Temporada').astype(str).astype('category')
+    )
     
     # OPTIMIZATION: Process store names more efficiently - Clean whitespace from store names
     if 'Tienda' in df_traspasos.columns:
-        df_traspasos['Tienda'] = df_traspasos['Tienda'].astype(str).str.strip()
+        df_traspasos['Tienda'] = df_traspasos['Tienda'].astype(str).str.strip().astype('category')
     
     # OPTIMIZATION: Process numeric columns more efficiently
     if 'Cantidad enviada' in df_traspasos.columns:
-        df_traspasos['Cantidad enviada'] = pd.to_numeric(df_traspasos['Cantidad enviada'], errors='coerce').fillna(0)
+        df_traspasos['Cantidad enviada'] = reducir_a_int32(
+            pd.to_numeric(df_traspasos['Cantidad enviada'], errors='coerce').fillna(0)
+        )
     
     # OPTIMIZATION: Handle color column more efficiently
     if 'Color' not in df_traspasos.columns:
@@ -3528,17 +3158,23 @@ def preprocess_traspasos_data(df_traspasos):
     
     return df_traspasos
 
-# Cached function for consistent temporada colors
-@st.cache_data
 def get_temporada_colors(df_ventas):
     """Get consistent color mapping for temporadas across all charts"""
-    temporadas = sorted(df_ventas['Temporada'].unique())
+    # Las temporadas presentes salen de los códigos de la categoría; el mapping se cachea por tupla
+    return build_temporada_colors(tuple(valores_presentes(df_ventas['Temporada'])))
+
+# Cached function for consistent temporada colors
+@st.cache_data(show_spinner=False)
+def build_temporada_colors(temporadas):
+    """Color mapping for an ordered tuple of temporadas"""
     color_mapping = {}
     for i, temp in enumerate(temporadas):
         color_mapping[temp] = TEMPORADA_COLORS[i % len(TEMPORADA_COLORS)]
     return color_mapping
 
 # New cached functions for Resumen General optimization
+NS_POR_DIA = 86_400 * 10**9
+
 @st.cache_data
 def calculate_rotation_metrics(df_productos, df_traspasos, df_ventas):
     """Cache the rotation calculation which is very expensive - OPTIMIZED VERSION"""
@@ -3549,24 +3185,12 @@ def calculate_rotation_metrics(df_productos, df_traspasos, df_ventas):
     df_productos_rotacion = df_productos[['Código único', 'Talla', 'Fecha almacén']].copy()
     
     # More robust date parsing
-    try:
-        df_productos_rotacion['Fecha almacén'] = pd.to_datetime(df_productos_rotacion['Fecha almacén'], format='%d/%m/%Y', errors='coerce')
-    except:
-        try:
-            df_productos_rotacion['Fecha almacén'] = pd.to_datetime(df_productos_rotacion['Fecha almacén'], dayfirst=True, errors='coerce')
-        except:
-            df_productos_rotacion['Fecha almacén'] = pd.to_datetime(df_productos_rotacion['Fecha almacén'], errors='coerce')
+    df_productos_rotacion['Fecha almacén'] = parse_fechas(df_productos_rotacion['Fecha almacén'])
     
     ventas_rotacion = df_ventas[['Código único', 'Talla', 'Tienda', 'Fecha venta', 'Familia']].copy()
     
     # More robust date parsing for sales
-    try:
-        ventas_rotacion['Fecha venta'] = pd.to_datetime(ventas_rotacion['Fecha venta'], format='%d/%m/%Y', errors='coerce')
-    except:
-        try:
-            ventas_rotacion['Fecha venta'] = pd.to_datetime(ventas_rotacion['Fecha venta'], dayfirst=True, errors='coerce')
-        except:
-            ventas_rotacion['Fecha venta'] = pd.to_datetime(ventas_rotacion['Fecha venta'], errors='coerce')
+    ventas_rotacion['Fecha venta'] = parse_fechas(ventas_rotacion['Fecha venta'])
     
     # Filter out invalid dates early for better performance
     df_productos_rotacion = df_productos_rotacion.dropna(subset=['Fecha almacén'])
@@ -3586,35 +3210,30 @@ def calculate_rotation_metrics(df_productos, df_traspasos, df_ventas):
         return None, None, None, None, None, None, None, None, None, None, None, None
     
     # Use sales + warehouse data directly (more reliable than trying to match transfers)
-    rotacion_completa = ventas_con_entrada.copy()
-    
-    # Calculate rotation days with validation
-    rotacion_completa['Dias_Rotacion'] = (
-        rotacion_completa['Fecha venta'] - rotacion_completa['Fecha almacén']
-    ).dt.days
+    # OPTIMIZATION: Días de rotación sobre los datetime64 como enteros (ns), sin pasar por .dt.days
+    # ni copiar el resultado del merge. El floor_divide reproduce el redondeo de .dt.days.
+    ns_venta = ventas_con_entrada['Fecha venta'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    ns_almacen = ventas_con_entrada['Fecha almacén'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    dias_rotacion = np.floor_divide(ns_venta - ns_almacen, NS_POR_DIA)
     
     # Filter valid rotation days (0-365 days to avoid extreme outliers)
-    # Also ensure sales date is after warehouse entry date
-    rotacion_completa = rotacion_completa[
-        (rotacion_completa['Dias_Rotacion'] >= 0) & 
-        (rotacion_completa['Dias_Rotacion'] <= 365) &
-        (rotacion_completa['Fecha venta'] >= rotacion_completa['Fecha almacén'])
-    ]
-    
-
+    # Dias >= 0 ya garantiza que la venta es posterior a la entrada en almacén
+    mask_valida = (dias_rotacion >= 0) & (dias_rotacion <= 365)
+    rotacion_completa = ventas_con_entrada.loc[mask_valida, ['Código único', 'Tienda', 'Familia']]
+    rotacion_completa = rotacion_completa.assign(Dias_Rotacion=dias_rotacion[mask_valida])
     
     # Only proceed if we have enough valid data
     if len(rotacion_completa) < 10:
         return None, None, None, None, None, None, None, None, None, None, None, None
     
     # Calculate comprehensive rotation metrics by store
-    rotacion_por_tienda = rotacion_completa.groupby('Tienda').agg({
+    rotacion_por_tienda = rotacion_completa.groupby('Tienda', observed=True).agg({
         'Dias_Rotacion': ['mean', 'median', 'std', 'count']
     }).reset_index()
     rotacion_por_tienda.columns = ['Tienda', 'Dias_Promedio', 'Dias_Mediana', 'Dias_Std', 'Productos_Con_Rotacion']
     
     # Calculate comprehensive rotation metrics by product
-    rotacion_por_producto = rotacion_completa.groupby(['Código único', 'Familia']).agg({
+    rotacion_por_producto = rotacion_completa.groupby(['Código único', 'Familia'], observed=True).agg({
         'Dias_Rotacion': ['mean', 'median', 'std', 'count']
     }).reset_index()
     rotacion_por_producto.columns = ['Código único', 'Familia', 'Dias_Promedio', 'Dias_Mediana', 'Dias_Std', 'Ventas_Con_Rotacion']
@@ -3676,38 +3295,15 @@ def calculate_rotation_metrics(df_productos, df_traspasos, df_ventas):
         promedio_global, mediana_global, std_global, len(rotacion_completa)
     )
 
-@st.cache_data
-def calculate_basic_kpis(df_ventas):
-    """Cache basic KPI calculations"""
-    total_ventas_dinero = df_ventas['Beneficio'].sum()
-    total_familias = df_ventas['Familia'].nunique()
-    
-    # Calculate returns (monetary amount of negative quantities)
-    devoluciones = df_ventas[df_ventas['Cantidad'] < 0]
-    total_devoluciones_dinero = abs(devoluciones['Beneficio'].sum())
-    
-    # Separate physical and online stores
-    ventas_fisicas = df_ventas[~df_ventas['Es_Online']]
-    ventas_online = df_ventas[df_ventas['Es_Online']]
-    
-    # Calculate KPIs by store type
-    ventas_fisicas_dinero = ventas_fisicas['Beneficio'].sum()
-    ventas_online_dinero = ventas_online['Beneficio'].sum()
-    tiendas_fisicas = ventas_fisicas['Tienda'].nunique()
-    tiendas_online = ventas_online['Tienda'].nunique()
-    
-    return (total_ventas_dinero, total_devoluciones_dinero, total_familias, 
-            ventas_fisicas_dinero, ventas_online_dinero, tiendas_fisicas, tiendas_online)
-
 @st.cache_data
 def calculate_monthly_sales_data(df_ventas):
     """Cache monthly sales data calculation"""
-    ventas_mes_tipo = df_ventas.groupby(['Mes', 'Es_Online']).agg({
+    # Mes es una category ordenada: observed=True agrupa solo los meses presentes, en orden cronológico
+    ventas_mes_tipo = df_ventas.groupby(['Mes', 'Es_Online'], observed=True).agg({
         'Cantidad': 'sum',
         'Beneficio': 'sum'
     }).reset_index()
     
-    
     ventas_mes_tipo['Tipo'] = ventas_mes_tipo['Es_Online'].map({True: 'Online', False: 'Física'})
     
     return ventas_mes_tipo
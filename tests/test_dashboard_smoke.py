@@ -0,0 +1,102 @@
+"""
+Prueba de humo del dashboard: ejecuta mostrar_dashboard con datos sintéticos en cada sección
+mediante streamlit.testing.v1.AppTest y comprueba que se renderiza sin excepciones ni errores.
+"""
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("plotly")
+pytest.importorskip("catboost")
+pytest.importorskip("joblib")
+
+from streamlit.testing.v1 import AppTest
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "attached_assets")
+
+SECCIONES = [
+    "Resumen General",
+    "Geográfico y Tiendas",
+    "Producto, Campaña, Devoluciones y Rentabilidad",
+    "Análisis con fotos",
+]
+
+
+def _app_dashboard(assets_dir, seccion):
+    import sys
+
+    import numpy as np
+    import pandas as pd
+
+    sys.path.insert(0, assets_dir)
+    from dashboard_correct import mostrar_dashboard
+
+    rng = np.random.default_rng(0)
+    tiendas = ["T001 MADRID", "T002 BARCELONA", "TRUCCO ONLINE", "I301COINBERGAMO", "I302COINMILANO"]
+    zonas = ["Centro", "Cataluña", "Online", "Italia", "Italia"]
+    codigos = [f"ACT{i:03d}" for i in range(12)]
+    tallas = ["XS", "S", "M", "L", "XL", "38"]
+    temporadas = ["I2024", "V2025"]
+    familias = ["Camisas", "Pantalones", "Vestidos"]
+    fechas = pd.date_range("2024-01-01", "2025-06-30", freq="D")
+
+    n = 600
+    idx_tienda = rng.integers(0, len(tiendas), n)
+    idx_codigo = rng.integers(0, len(codigos), n)
+    cantidad = rng.integers(-1, 4, n)
+    pvp = rng.uniform(20, 80, n).round(2)
+    df_ventas = pd.DataFrame({
+        "TPV": [f"{i:03d}" for i in idx_tienda],
+        "NombreTPV": np.array(tiendas)[idx_tienda],
+        "Zona geográfica": np.array(zonas)[idx_tienda],
+        "Fecha Documento": pd.Series(rng.choice(fechas, n)).dt.strftime("%d/%m/%Y"),
+        "Temporada": np.array(temporadas)[idx_codigo % 2],
+        "ACT": np.array(codigos)[idx_codigo],
+        "Talla": rng.choice(tallas, n),
+        "Familia": "F1",
+        "Descripción Familia": np.array(familias)[idx_codigo % 3],
+        "Descripción Color": rng.choice(["Negro", "Blanco"], n),
+        "Cantidad": cantidad,
+        "P.V.P.": pvp,
+        "Subtotal": (cantidad * pvp).round(2),
+        "url_image": "",
+    })
+
+    m = 200
+    idx_prod = rng.integers(0, len(codigos), m)
+    df_productos = pd.DataFrame({
+        "ACT": np.array(codigos)[idx_prod],
+        "Talla": rng.choice(tallas, m),
+        "Tema": np.array(["T_I2024_A", "T_V2025_B"])[idx_prod % 2],
+        "Cantidad Pedida": rng.integers(1, 20, m),
+        "Fecha REAL entrada en almacén": pd.Series(rng.choice(fechas[:300], m)).dt.strftime("%d/%m/%Y"),
+        "Precio Coste": rng.uniform(5, 20, m).round(2),
+        "P.V.P.": rng.uniform(20, 80, m).round(2),
+        "Descripción Color": rng.choice(["Negro", "Blanco"], m),
+    })
+
+    k = 300
+    idx_tras = rng.integers(0, len(codigos), k)
+    df_traspasos = pd.DataFrame({
+        "Fecha Documento": pd.Series(rng.choice(fechas, k)).dt.strftime("%d/%m/%Y"),
+        "NombreTpvDestino": rng.choice(tiendas, k),
+        "Temporada": np.array(temporadas)[idx_tras % 2],
+        "ACT": np.array(codigos)[idx_tras],
+        "Talla": rng.choice(tallas, k),
+        "Enviado": rng.integers(1, 10, k),
+    })
+
+    mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion)
+
+
+@pytest.mark.parametrize("seccion", SECCIONES)
+def test_mostrar_dashboard_renderiza_cada_seccion(seccion):
+    at = AppTest.from_function(_app_dashboard, args=(ASSETS_DIR, seccion), default_timeout=120)
+    at.run()
+    assert not at.exception, [e.message for e in at.exception]
+    assert not at.error, [e.value for e in at.error]
+    # Un segundo run reutiliza las cachés (huellas y st.cache_data) como en un rerun real
+    at.run()
+    assert not at.exception, [e.message for e in at.exception]
+    assert not at.error, [e.value for e in at.error]